@@ -2,98 +2,451 @@ import requests
 import pickle
 import gzip
 import os
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from requests.adapters import HTTPAdapter
+from otlp import parse_traces
+from jaeger_decode import decode_trace, loads
 from trace_model import Trace
-from utils import get_jaeger_nodeport
+from response_cache import ResponseCache
+from trace_store import TraceChunkWriter, write_json_atomic
+from trace_stitcher import TraceStitcher, looks_truncated
+from utils import get_jaeger_nodeport, get_prometheus_nodeport, read_timestamps, utc_microtime
+
+FETCH_STATE = "fetch_state.json"
+CACHE_SETTLE_SECONDS = 60
+OTLP_HEADERS = {"Accept": "application/x-protobuf, application/json;q=0.5"}
 
 class JaegerDataFetcher:
-    def __init__(self, service_name, limit=1000):
-        # 获取 Jaeger 服务的 NodePort
-        self.port = get_jaeger_nodeport()
-        self.jaeger_base_url = f"http://localhost:{self.port}/jaeger/api/traces"
+    def __init__(self, service_name, limit=1000, concurrency=8, base_url=None, from_search=True, shards=1,
+                 cache_dir=None, cache_max_bytes=2 * 1024 ** 3, verbose=True,
+                 min_duration=None, max_duration=None, tags=None, operation=None, transport="json",
+                 server_limit=None):
+        """
+        :param service_name: Jaeger 中的服务名
+        :param limit: 每次查询返回的最大 trace 数
+        :param concurrency: 并发拉取单条 trace 的线程数（1 表示串行）
+        :param base_url: Jaeger traces API 地址，默认通过 NodePort 访问集群内的 Jaeger
+        :param from_search: 直接用搜索结果里的 spans 构造 Trace，只有疑似被截断的 trace 才按 ID 重新拉取
+        :param shards: 把时间范围切成多少个子窗口并行拉取
+        :param cache_dir: 查询结果的本地缓存目录，None 表示不缓存
+        :param cache_max_bytes: 缓存总大小上限，超过后按 LRU 淘汰
+        :param verbose: 是否打印每次查询和每轮拉取的汇总信息（错误信息总会打印）
+        :param min_duration: 只拉取耗时不小于该值的 traces，整数表示微秒，也可以是 "100ms" 这样的字符串
+        :param max_duration: 只拉取耗时不大于该值的 traces，格式同 min_duration
+        :param tags: 只拉取带有这些 tag 的 traces，例如 {"error": "true"}
+        :param operation: 只拉取该 operation 的 traces
+        以上过滤条件都直接作为 Jaeger 搜索参数，在服务端完成过滤
+        :param transport: "json" 使用 /api/traces 接口；"otlp" 使用 api_v3 接口并请求 OTLP protobuf 编码，
+                          解码后得到同样的 Trace 对象（需要 opentelemetry-proto，服务端只返回 JSON 时自动按 OTLP JSON 解析）
+        :param server_limit: 服务端实际生效的每页上限（例如网关忽略分页参数时使用的默认值、或者服务端配置的最大值），
+                             结果数达到 min(limit, server_limit) 即视为饱和，避免服务端截断了结果却被当作完整窗口
+        """
+        if base_url is None:
+            # 获取 Jaeger 服务的 NodePort
+            self.port = get_jaeger_nodeport()
+            base_url = f"http://localhost:{self.port}/jaeger/api/traces"
+        self.jaeger_base_url = base_url
+        self.otlp_base_url = base_url.replace("/api/traces", "/api/v3/traces")
+        self.transport = transport
         self.service_name = service_name
         self.limit = limit
+        self.server_limit = server_limit
+        self.concurrency = max(1, concurrency)
+        self.from_search = from_search
+        self.shards = max(1, shards)
+        self.filters = self._build_filters(min_duration, max_duration, tags, operation)
+        self.verbose = verbose
+        self.last_report = None
+        self.cache = ResponseCache(cache_dir, cache_max_bytes) if cache_dir else None
+        # 多服务拉取时由 MultiServiceFetcher 设置，用于拼接不完整的 trace
+        self.stitcher = None
+        self.session = self._create_session()
 
-    def fetch_all_traces(self, start_time, end_time):
+    @property
+    def page_limit(self):
         """
-        从 end_time 倒着获取 traces，直到 trace 里出现早于 start_time 的 span（这些 trace 会被丢弃）
-        :param start_time: 起始时间戳（微秒）
-        :param end_time: 结束时间戳（微秒）
-        :return: 所有 trace 数据
+        每次查询实际能返回的最大 trace 数，结果数达到它说明窗口内可能还有没返回的 trace
         """
-        current_end = int(end_time)
-        all_traces = []
-        seen_trace_ids = set()
+        return min(self.limit, self.server_limit) if self.server_limit else self.limit
+
+    def _create_session(self):
+        # 所有请求共用一个 keep-alive 连接池，池大小覆盖分片查询和详情拉取两类并发
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency + self.shards)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @staticmethod
+    def _build_filters(min_duration, max_duration, tags, operation):
+        def as_duration(value):
+            return f"{value}us" if isinstance(value, int) else value
 
-        while current_end > start_time:
+        filters = {}
+        if min_duration is not None:
+            filters["minDuration"] = as_duration(min_duration)
+        if max_duration is not None:
+            filters["maxDuration"] = as_duration(max_duration)
+        if tags:
+            filters["tags"] = json.dumps(tags, sort_keys=True)
+        if operation:
+            filters["operation"] = operation
+        return filters
+
+    @staticmethod
+    def _to_trace(trace_json):
+        # 拉取到的 trace 直接打包成惰性 Trace：不创建 Span 对象，内存占用更小，
+        # 落盘后只用 total_duration / start_time 的统计加载时也不需要解析 spans
+        return Trace({"data": [trace_json]}, lazy=True).pack()
+
+    def _get(self, url, params=None, cacheable=True, headers=None):
+        """
+        发送 GET 请求。启用缓存时先查缓存，成功的响应写回缓存
+        :param cacheable: 结果是否已经稳定、可以缓存（时间窗口尚未结束的查询不应缓存）
+        :return: (状态码, 响应内容 bytes)，状态码非 200 时内容为 None
+        """
+        if self.cache and cacheable:
+            content = self.cache.get(url, params)
+            if content is not None:
+                return 200, content
+
+        response = self.session.get(url, params=params, headers=headers)
+        if response.status_code != 200:
+            return response.status_code, None
+
+        if self.cache and cacheable:
+            self.cache.put(url, params, response.content)
+        return 200, response.content
+
+    @staticmethod
+    def _rfc3339(timestamp_us):
+        seconds, micros = divmod(int(timestamp_us), 1_000_000)
+        return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S") + f".{micros:06d}Z"
+
+    def _search(self, start_time, end_time, cacheable):
+        """
+        搜索 [start_time, end_time] 内的 traces
+        :return: (状态码, Jaeger 格式的 trace dict 列表)
+        """
+        if self.transport == "otlp":
             params = {
-                'service': self.service_name,
-                'limit': self.limit,
-                'end': current_end
+                "query.service_name": self.service_name,
+                "query.start_time_min": self._rfc3339(start_time),
+                "query.start_time_max": self._rfc3339(end_time),
+                # 不同版本的 api_v3 网关读取的分页参数名不同，两个都传
+                "query.search_depth": self.limit,
+                "query.num_traces": self.limit,
             }
+            if "minDuration" in self.filters:
+                params["query.duration_min"] = self.filters["minDuration"]
+            if "maxDuration" in self.filters:
+                params["query.duration_max"] = self.filters["maxDuration"]
+            if "operation" in self.filters:
+                params["query.operation_name"] = self.filters["operation"]
+            for key, value in json.loads(self.filters.get("tags", "{}")).items():
+                params[f"query.attributes[{key}]"] = value
+
+            status_code, content = self._get(self.otlp_base_url, params, cacheable, OTLP_HEADERS)
+            return status_code, parse_traces(content) if status_code == 200 else None
+
+        params = {
+            'service': self.service_name,
+            'limit': self.limit,
+            'start': start_time,
+            'end': end_time,
+            **self.filters
+        }
+        status_code, content = self._get(self.jaeger_base_url, params, cacheable)
+        return status_code, (loads(content).get("data") or []) if status_code == 200 else None
+
+    @staticmethod
+    def _is_settled(end_time):
+        # 结束时间早于当前时间 CACHE_SETTLE_SECONDS 以上的窗口不会再有新的 trace 写入
+        return int(end_time) < utc_microtime() - CACHE_SETTLE_SECONDS * 1_000_000
+
+    def _fetch_trace(self, trace_id, cacheable=True):
+        """
+        按 traceID 拉取单条 trace，失败时返回 None
+        """
+        try:
+            if self.transport == "otlp":
+                status_code, content = self._get(f"{self.otlp_base_url}/{trace_id}", None, cacheable, OTLP_HEADERS)
+                trace_data = parse_traces(content) if status_code == 200 else []
+                return self._to_trace(trace_data[0]) if trace_data else None
 
-            print(f"🔄 Fetching traces from {start_time} to {current_end}...")
-            response = requests.get(self.jaeger_base_url, params=params)
+            status_code, content = self._get(f"{self.jaeger_base_url}/{trace_id}", cacheable=cacheable)
+            return decode_trace(content, lazy=True) if status_code == 200 else None
+        except requests.exceptions.RequestException as e:
+            print(f"❌ 请求失败 trace: {trace_id}: {e}")
+        except ValueError:
+            print(f"❌ 解码失败 trace: {trace_id}")
+        return None
 
-            if response.status_code != 200:
-                print(f"❌ 请求失败: {response.status_code}")
-                break
+    @staticmethod
+    def _split_window(start_time, end_time, shards):
+        """
+        把 [start_time, end_time] 均分成 shards 个互不重叠的子窗口
+        """
+        start_time, end_time = int(start_time), int(end_time)
+        shards = max(1, min(shards, end_time - start_time + 1))
+        step = (end_time - start_time + 1) / shards
+        bounds = [start_time + int(i * step) for i in range(shards)] + [end_time + 1]
+        return [(bounds[i], bounds[i + 1] - 1) for i in range(shards)]
 
-            trace_data = response.json().get("data", [])
-            if not trace_data:
-                print("✅ 没有更多 traces。")
-                break
+    def _service_start(self, trace):
+        """
+        被查询服务在这条 trace 中最早的 span 开始时间，没有该服务的 span 时返回 None
+        """
+        pids = {pid for pid, info in (trace.get("processes") or {}).items()
+                if info.get("serviceName") == self.service_name}
+        starts = [span.get("startTime", 0) for span in trace["spans"] if span.get("processID") in pids]
+        return min(starts) if starts else None
 
-            min_start = float('inf')
-            max_end = 0
+    def _query_window(self, start_time, end_time, seen_trace_ids, seen_lock, executor):
+        """
+        查询一个时间窗口 [start_time, end_time] 内的 traces
+        :return: (Trace 列表, 状态)，状态为 "ok" / "saturated"（结果数达到 page_limit）/ "failed"
+        """
+        if self.verbose:
+            print(f"🔄 Fetching traces from {start_time} to {end_time}...")
+        cacheable = self._is_settled(end_time)
+        try:
+            status_code, trace_data = self._search(start_time, end_time, cacheable)
+        except requests.exceptions.RequestException as e:
+            print(f"❌ 请求失败: {e}")
+            return [], "failed"
 
-            found_too_old = False
+        if status_code != 200:
+            print(f"❌ 请求失败: {status_code}")
+            return [], "failed"
 
-            for trace in trace_data:
-                trace_id = trace["traceID"]
+        traces = []
+        pending_ids = []
+
+        for trace in trace_data:
+            trace_id = trace["traceID"]
+            spans = trace.get("spans", [])
+            if not spans:
+                continue
+
+            # Jaeger 按被查询服务的 span 匹配时间窗口：该服务最早的 span 早于窗口起点时，这条 trace 属于更早的窗口。
+            # 不能看 spans[0]：根 span（例如 loadgenerator）通常比 frontend 早几毫秒，跨窗口边界的 trace 会两边都丢掉
+            service_start = self._service_start(trace)
+            if service_start is not None and service_start < start_time:
+                continue
+
+            with seen_lock:
                 if trace_id in seen_trace_ids:
+                    # 其他服务的查询拿到过这条 trace 但不完整时，用这份副本补齐
+                    if self.stitcher and self.stitcher.is_partial(trace_id):
+                        stitched = self.stitcher.add(trace)
+                        if stitched:
+                            traces.append(self._to_trace(stitched))
                     continue
                 seen_trace_ids.add(trace_id)
-
-                spans = trace.get("spans", [])
-                if not spans:
+                if self.stitcher and self.from_search and looks_truncated(trace):
+                    self.stitcher.add(trace)
                     continue
 
-                first_span = spans[0]
-                span_start = first_span.get("startTime", 0)
-                span_end = span_start + first_span.get("duration", 0)
+            if self.from_search and not looks_truncated(trace):
+                traces.append(self._to_trace(trace))
+            else:
+                pending_ids.append(trace_id)
 
-                # 检查是否太早，直接跳过这个 trace
-                if span_start < start_time:
-                    found_too_old = True
-                    continue
+        # 需要单独拉取的 trace 详情并发拉取
+        for trace in executor.map(self._fetch_trace, pending_ids, repeat(cacheable)):
+            if trace is not None:
+                traces.append(trace)
 
-                min_start = min(min_start, span_start)
-                max_end = max(max_end, span_end)
+        return traces, "saturated" if len(trace_data) >= self.page_limit else "ok"
 
-                trace_response = requests.get(f"{self.jaeger_base_url}/{trace_id}")
-                if trace_response.status_code == 200:
-                    try:
-                        trace = Trace(trace_response.json())
-                        all_traces.append(trace)
-                    except requests.exceptions.JSONDecodeError:
-                        print(f"❌ 解码失败 trace: {trace_id}")
+    @staticmethod
+    def _new_report(start_time, end_time):
+        return {
+            "queries": 0,
+            "saturated_queries": 0,
+            "traces": 0,
+            "coverage": 0.0,
+            "covered_us": 0,
+            "total_us": int(end_time) - int(start_time) + 1,
+            "unresolved_windows": [],
+            "failed_windows": [],
+        }
 
-            print(f"🕒 当前 batch 最小 start: {min_start}, 最大 end: {max_end}")
+    def _harvest(self, pending, seen_trace_ids, report, sink, checkpoint=None, seen_lock=None):
+        """
+        并行查询 pending 中的时间窗口，按 traceID 全局去重，每批结果交给 sink。
+        结果数达到 limit 的窗口说明 Jaeger 只返回了一部分，对半拆分后重新查询，直到每个窗口都不饱和。
+        覆盖情况记录在 report 中，结束后同时保存到 self.last_report。
+        :param pending: 待查询的 (start, end) 窗口列表
+        :param seen_trace_ids: 已获取的 traceID 集合
+        :param report: 覆盖率统计，由 _new_report 创建
+        :param sink: 接收 Trace 列表的回调
+        :param checkpoint: 每轮查询结束后调用 checkpoint(next_pending, report)
+        :param seen_lock: 保护 seen_trace_ids 的锁，多个 fetcher 共用同一个集合时需要传入同一把锁
+        :return: 获取到的 trace 数
+        """
+        seen_lock = seen_lock or threading.Lock()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor, \
+                ThreadPoolExecutor(max_workers=self.shards) as shard_pool:
+            while pending:
+                futures = [
+                    shard_pool.submit(self._query_window, window_start, window_end,
+                                      seen_trace_ids, seen_lock, executor)
+                    for window_start, window_end in pending
+                ]
+
+                next_pending = []
+                for (window_start, window_end), future in zip(pending, futures):
+                    traces, status = future.result()
+                    sink(traces)
+                    report["traces"] += len(traces)
+                    report["queries"] += 1
 
-            if found_too_old:
-                print("⏹️ 遇到早于 start_time 的 trace，停止拉取。")
-                break
+                    if status == "ok":
+                        report["covered_us"] += window_end - window_start + 1
+                    elif status == "failed":
+                        report["failed_windows"].append((window_start, window_end))
+                    elif window_end > window_start:
+                        # 饱和窗口对半拆分
+                        report["saturated_queries"] += 1
+                        middle = (window_start + window_end) // 2
+                        next_pending.append((window_start, middle))
+                        next_pending.append((middle + 1, window_end))
+                    else:
+                        # 1 微秒内的 trace 数仍超过 limit，无法再拆分
+                        report["saturated_queries"] += 1
+                        report["unresolved_windows"].append((window_start, window_end))
 
-            # 更新下一次的 end_time（往前挪）
-            if min_start == float('inf') or min_start <= start_time:
-                print("⛔ 没有更早的 traces，终止。")
-                break
+                pending = next_pending
+                if checkpoint:
+                    checkpoint(pending, report)
 
-            current_end = min_start - 1
+        report["coverage"] = report["covered_us"] / report["total_us"] if report["total_us"] > 0 else 1.0
+        self.last_report = report
 
-        print(f"📦 共获取 {len(all_traces)} 条 traces")
+        if self.cache:
+            report["cache"] = self.cache.stats()
+        if self.verbose:
+            self.print_report(report)
+        return report["traces"]
+
+    @staticmethod
+    def print_report(report):
+        print(f"📦 共获取 {report['traces']} 条 traces")
+        print(f"📈 查询 {report['queries']} 次（饱和 {report['saturated_queries']} 次），"
+              f"时间覆盖率 {report['coverage']:.2%}，"
+              f"未解决窗口 {len(report['unresolved_windows'])} 个，失败窗口 {len(report['failed_windows'])} 个")
+        if "cache" in report:
+            print(f"🗄️ 缓存命中 {report['cache']['hits']} 次，未命中 {report['cache']['misses']} 次")
+
+    def fetch_all_traces(self, start_time, end_time):
+        """
+        获取 [start_time, end_time] 内的所有 traces，全部保存在内存中返回
+        :param start_time: 起始时间戳（微秒）
+        :param end_time: 结束时间戳（微秒）
+        :return: 所有 trace 数据
+        """
+        all_traces = []
+        pending = self._split_window(start_time, end_time, self.shards)
+        self._harvest(pending, set(), self._new_report(start_time, end_time), all_traces.extend)
         return all_traces
 
+    def _load_state(self, state_file, start_time, end_time):
+        """
+        读取断点文件，只有服务名和时间范围都一致时才认为可以续传
+        """
+        if not os.path.isfile(state_file):
+            return None
+        with open(state_file) as f:
+            state = json.load(f)
+        if (state.get("service") != self.service_name or state.get("filters", {}) != self.filters
+                or state.get("start_time") != int(start_time) or state.get("end_time") != int(end_time)):
+            print(f"⚠️ 断点文件与本次拉取参数不一致，重新开始: {state_file}")
+            return None
+        return state
+
+    def stream_traces(self, start_time, end_time, output_dir, chunk_size=10000, resume=True):
+        """
+        流式获取 [start_time, end_time] 内的 traces，边拉取边按 chunk_size 写入 output_dir/trace_chunks，
+        内存中只保留去重用的 traceID 集合和当前 chunk。
+        每轮查询结束后把剩余窗口、覆盖率统计写入 output_dir/fetch_state.json，
+        中途失败（端口转发断开、5xx 等）后重新调用会从断点继续，之前失败的窗口也会重试。
+        :param resume: 是否从已有的断点继续
+        :return: 获取到的 trace 数
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        state_file = os.path.join(output_dir, FETCH_STATE)
+        state = self._load_state(state_file, start_time, end_time) if resume else None
+        writer = TraceChunkWriter(output_dir, chunk_size, resume=state is not None)
+
+        if state is None:
+            pending = self._split_window(start_time, end_time, self.shards)
+            report = self._new_report(start_time, end_time)
+            seen_trace_ids = set()
+        else:
+            report = state["report"]
+            pending = state["pending"] + report["failed_windows"]
+            report["failed_windows"] = []
+            # 以已落盘的数据为准，崩溃前写了一半的那轮查询会整体重做
+            report["traces"] = writer.total
+            seen_trace_ids = writer.load_trace_ids()
+            if not pending:
+                print(f"✅ 已完成拉取，共 {writer.total} 条 traces: {output_dir}")
+                self.last_report = report
+                return writer.total
+            print(f"🔁 从断点继续: 已有 {writer.total} 条 traces，剩余 {len(pending)} 个窗口")
+
+        def checkpoint(next_pending, current_report):
+            writer.flush()
+            write_json_atomic(state_file, {
+                "service": self.service_name,
+                "filters": self.filters,
+                "start_time": int(start_time),
+                "end_time": int(end_time),
+                "pending": next_pending,
+                "report": current_report,
+            })
+
+        checkpoint(pending, report)
+        try:
+            total = self._harvest(pending, seen_trace_ids, report, writer.extend, checkpoint)
+        finally:
+            writer.close()
+
+        if report["failed_windows"]:
+            print(f"⚠️ 有 {len(report['failed_windows'])} 个窗口拉取失败，重新运行即可从断点重试")
+        return total
+
+    def count_traces(self, start_time, end_time, prometheus_url=None):
+        """
+        用 Prometheus 中 istio_requests_total 的增量估算 [start_time, end_time] 内根服务收到的请求数，
+        即未过滤时的 trace 总数。只需要一次查询，不拉取任何 trace；配合 min_duration 过滤拉取的慢 trace，
+        可以用 utils.tail_percentiles 计算尾部分位数。采样率低于 100% 时需要自行乘以采样率。
+        :param prometheus_url: Prometheus 即时查询接口地址，默认通过 NodePort 访问集群内的 Prometheus
+        :return: 请求数
+        """
+        if prometheus_url is None:
+            prometheus_url = f"http://localhost:{get_prometheus_nodeport()}/api/v1/query"
+
+        name, _, namespace = self.service_name.partition(".")
+        selector = f'reporter="destination",destination_service_name="{name}"'
+        if namespace:
+            selector += f',destination_service_namespace="{namespace}"'
+        seconds = max(1, round((int(end_time) - int(start_time)) / 1_000_000))
+        query = f"sum(increase(istio_requests_total{{{selector}}}[{seconds}s]))"
+
+        response = self.session.get(prometheus_url, params={"query": query, "time": int(end_time) / 1_000_000})
+        response.raise_for_status()
+        result = response.json()["data"]["result"]
+        return round(float(result[0]["value"][1])) if result else 0
+
     def save_traces(self, trace_data, output_dir):
         """
         保存 traces 数据到指定目录
@@ -107,23 +460,194 @@ class JaegerDataFetcher:
 
         print(f"✅ traces 数据已保存至 {output_file}")
 
-if __name__ == "__main__":
-    # 示例服务名，可以替换为你的服务名
-    service_name = "frontend.default"  # 替换为你的 Jaeger 服务名
-    global_start_ts_micro = 1743955535688697
-    global_end_ts_micro = 1743955840097186
+class TailHarvester(threading.Thread):
+    """
+    在策略运行期间后台轮询 Jaeger，每隔 interval 秒拉取 [上次位置, 当前时间 - lag] 内已完成的 traces，
+    并持续写入 output_dir/trace_chunks。运行窗口结束时调用 stop(end_time)，
+    线程会等到 end_time 之后的 lag 秒，补齐最后一段再退出，此时拉取基本已经完成。
+    """
+
+    def __init__(self, fetcher, start_time, output_dir, chunk_size=10000, interval=5, lag=10):
+        """
+        :param fetcher: JaegerDataFetcher 实例
+        :param start_time: 运行窗口起始时间戳（微秒）
+        :param interval: 轮询间隔（秒）
+        :param lag: 只拉取 lag 秒之前开始的 traces，给 span 上报留出时间
+        """
+        super().__init__(daemon=True)
+        self.fetcher = fetcher
+        self.fetcher.verbose = False
+        self.start_time = int(start_time)
+        self.cursor = self.start_time
+        self.end_time = None
+        self.interval = interval
+        self.lag_us = int(lag * 1_000_000)
+        self.writer = TraceChunkWriter(output_dir, chunk_size)
+        self.seen_trace_ids = set()
+        self.report = fetcher._new_report(start_time, start_time)
+        self.error = None
+        self._stop_flag = threading.Event()
+
+    def stop(self, end_time):
+        self.end_time = int(end_time)
+        self._stop_flag.set()
+
+    def _poll(self, window_end):
+        if window_end < self.cursor:
+            return
+        self.report["total_us"] = window_end - self.start_time + 1
+        self.fetcher._harvest([(self.cursor, window_end)], self.seen_trace_ids, self.report, self.writer.extend)
+        self.cursor = window_end + 1
+
+    def run(self):
+        print("🟢 开始实时拉取 traces")
+        try:
+            while not self._stop_flag.wait(self.interval):
+                self._poll(utc_microtime() - self.lag_us)
+
+            # 等最后一段时间窗口内的 spans 上报完成后补齐
+            wait_seconds = (self.end_time + self.lag_us - utc_microtime()) / 1_000_000
+            if wait_seconds > 0:
+                time.sleep(wait_seconds)
+            self._poll(self.end_time)
+
+            # 失败的窗口重试一次
+            failed_windows, self.report["failed_windows"] = self.report["failed_windows"], []
+            if failed_windows:
+                self.fetcher._harvest(failed_windows, self.seen_trace_ids, self.report, self.writer.extend)
+        except Exception as e:
+            self.error = e
+            print(f"❌ 实时拉取出错：{e}")
+        finally:
+            self.writer.close()
 
-    experiment_dir = "data/onlineBoutique/1743955376367504"
+        print("📴 停止实时拉取")
+        self.fetcher.print_report(self.report)
 
-    # 创建 JaegerDataFetcher 实例
-    jaeger_fetcher = JaegerDataFetcher(service_name)
+class MultiServiceFetcher:
+    """
+    同时以多个服务为入口拉取 traces：每个服务各自按时间窗口查询（查询量分摊到各个服务，而不是都压在根服务上），
+    不经过根服务的后台调用、内部调用也能拿到。所有服务共用一个 traceID 去重集合，
+    某个服务拿到的不完整 trace 会用其他服务查到的副本按 spanID 拼接补齐。
+    """
+
+    def __init__(self, service_names, service_concurrency=4, base_url=None, **fetcher_kwargs):
+        """
+        :param service_names: Jaeger 中的服务名列表，例如 ["frontend.default", "cartservice.default"]
+        :param service_concurrency: 同时拉取的服务数
+        :param fetcher_kwargs: 传给每个 JaegerDataFetcher 的其他参数（limit、concurrency、shards、cache_dir、过滤条件等）
+        """
+        if base_url is None:
+            base_url = f"http://localhost:{get_jaeger_nodeport()}/jaeger/api/traces"
+        self.service_concurrency = max(1, service_concurrency)
+        self.verbose = fetcher_kwargs.pop("verbose", True)
+        self.stitcher = TraceStitcher()
+        self.fetchers = [JaegerDataFetcher(name, base_url=base_url, verbose=False, **fetcher_kwargs)
+                         for name in service_names]
+        for fetcher in self.fetchers:
+            fetcher.stitcher = self.stitcher
+        self.last_report = None
+
+    def _harvest(self, start_time, end_time, seen_trace_ids, sink):
+        """
+        并行拉取所有服务，最后把仍不完整的 trace 按 ID 补拉一次（补拉失败则保留拼接结果）
+        :return: 获取到的 trace 数
+        """
+        seen_lock = threading.Lock()
+        lock = threading.Lock()
+        reports = {}
+
+        def locked_sink(traces):
+            with lock:
+                sink(traces)
+
+        def harvest_service(fetcher):
+            report = fetcher._new_report(start_time, end_time)
+            pending = fetcher._split_window(start_time, end_time, fetcher.shards)
+            fetcher._harvest(pending, seen_trace_ids, report, locked_sink, seen_lock=seen_lock)
+            reports[fetcher.service_name] = report
+
+        with ThreadPoolExecutor(max_workers=self.service_concurrency) as pool:
+            list(pool.map(harvest_service, self.fetchers))
+
+        partial = self.stitcher.drain()
+        refetched = []
+        if partial:
+            fetcher = self.fetchers[0]
+            with ThreadPoolExecutor(max_workers=fetcher.concurrency) as pool:
+                refetched = list(pool.map(fetcher._fetch_trace, [trace["traceID"] for trace in partial],
+                                          repeat(fetcher._is_settled(end_time))))
+            sink([trace if trace is not None else JaegerDataFetcher._to_trace(stitched)
+                  for trace, stitched in zip(refetched, partial)])
+
+        self.last_report = {
+            "services": reports,
+            "traces": sum(report["traces"] for report in reports.values()) + len(partial),
+            "stitched": self.stitcher.stitched,
+            "refetched": sum(1 for trace in refetched if trace is not None),
+            "partial": sum(1 for trace in refetched if trace is None),
+        }
+        if self.verbose:
+            self.print_report(self.last_report)
+        return self.last_report["traces"]
+
+    @staticmethod
+    def print_report(report):
+        for service, service_report in report["services"].items():
+            print(f"🔹 {service}: ", end="")
+            JaegerDataFetcher.print_report(service_report)
+        print(f"📦 所有服务共获取 {report['traces']} 条 traces（去重后），拼接补齐 {report['stitched']} 条，"
+              f"按 ID 补拉 {report['refetched']} 条，仍不完整 {report['partial']} 条")
+
+    def fetch_all_traces(self, start_time, end_time):
+        """
+        获取 [start_time, end_time] 内所有服务的 traces，全部保存在内存中返回
+        """
+        all_traces = []
+        self._harvest(start_time, end_time, set(), all_traces.extend)
+        return all_traces
+
+    def stream_traces(self, start_time, end_time, output_dir, chunk_size=10000):
+        """
+        流式获取 [start_time, end_time] 内所有服务的 traces 并按 chunk 写入 output_dir/trace_chunks。
+        多服务拉取不支持断点续传（暂存的不完整 trace 无法恢复），每次都重新开始
+        :return: 获取到的 trace 数
+        """
+        writer = TraceChunkWriter(output_dir, chunk_size)
+        try:
+            return self._harvest(start_time, end_time, set(), writer.extend)
+        finally:
+            writer.close()
+
+    def save_traces(self, trace_data, output_dir):
+        self.fetchers[0].save_traces(trace_data, output_dir)
+
+if __name__ == "__main__":
+    import argparse
 
-    # 获取 Jaeger 数据并保存
-    trace_data = jaeger_fetcher.fetch_all_traces(global_start_ts_micro, global_end_ts_micro)
+    parser = argparse.ArgumentParser(description="拉取某个算法目录对应时间范围内的 Jaeger traces（支持断点续传）")
+    parser.add_argument("algo_dir", help="算法目录，需包含 timestamps.txt，例如 data/onlineBoutique/<实验编号>/ROUND_ROBIN")
+    parser.add_argument("--service", default="frontend.default", help="Jaeger 服务名，多个服务用逗号分隔时并行拉取并拼接")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--restart", action="store_true", help="忽略已有断点，重新拉取")
+    parser.add_argument("--cache-dir", default=None, help="查询结果缓存目录")
+    parser.add_argument("--min-duration", default=None, help="只拉取耗时不小于该值的 traces，例如 100ms")
+    parser.add_argument("--max-duration", default=None, help="只拉取耗时不大于该值的 traces")
+    parser.add_argument("--tags", type=json.loads, default=None, help='tag 过滤条件（JSON），例如 \'{"error": "true"}\'')
+    parser.add_argument("--operation", default=None, help="只拉取该 operation 的 traces")
+    parser.add_argument("--transport", choices=["json", "otlp"], default="json", help="查询接口：json 或 api_v3 OTLP")
+    parser.add_argument("--server-limit", type=int, default=None, help="服务端实际生效的每页 trace 数上限")
+    args = parser.parse_args()
 
-    # 如果抓取到数据，保存它
-    if trace_data:
-        # 保存 trace 数据到文件
-        jaeger_fetcher.save_traces(trace_data, experiment_dir)
+    start_ts, end_ts = read_timestamps(os.path.join(args.algo_dir, "timestamps.txt"))
+    fetcher_kwargs = dict(concurrency=args.concurrency, shards=args.shards, cache_dir=args.cache_dir,
+                          min_duration=args.min_duration, max_duration=args.max_duration, tags=args.tags,
+                          operation=args.operation, transport=args.transport, server_limit=args.server_limit)
+    services = args.service.split(",")
+    if len(services) > 1:
+        MultiServiceFetcher(services, **fetcher_kwargs).stream_traces(start_ts, end_ts, args.algo_dir, args.chunk_size)
     else:
-        print("没有找到任何 traces 数据。")
\ No newline at end of file
+        jaeger_fetcher = JaegerDataFetcher(args.service, **fetcher_kwargs)
+        jaeger_fetcher.stream_traces(start_ts, end_ts, args.algo_dir, args.chunk_size, resume=not args.restart)
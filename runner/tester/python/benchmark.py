@@ -0,0 +1,437 @@
+import argparse
+import contextlib
+import gzip
+import importlib.util
+import io
+import json
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from JaegerDataFetcher import JaegerDataFetcher
+from mock_jaeger import MockJaeger, make_trace, to_otlp_proto
+from otlp import parse_traces
+from collections import Counter
+
+from trace_model import Trace, SpanTable
+from trace_store import TraceChunkWriter, TraceChunks
+import jaeger_decode
+import parallel_loader
+import span_store
+import span_mmap
+import process_trace
+
+def _run_fetch(mock, start_ts, end_ts, **fetcher_kwargs):
+    fetcher = JaegerDataFetcher("frontend.default", base_url=mock.base_url, **fetcher_kwargs)
+    mock.request_count = 0
+    mock.bytes_sent = 0
+    begin = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        traces = fetcher.fetch_all_traces(start_ts, end_ts)
+    elapsed = time.perf_counter() - begin
+    # 窗口内有 frontend span 的 trace 都应该拿到，跨分片 / 拆分边界的 trace 丢失时 missing 不为 0
+    expected = {t["traceID"] for t in mock.search("frontend.default", start_ts, end_ts, len(mock.traces))}
+    missing = len(expected - {t.trace_id for t in traces})
+    options = " ".join(f"{k}={v!s:<5}" for k, v in fetcher_kwargs.items() if k != "limit")
+    print(f"📊 {options} traces={len(traces):<6} missing={missing:<4} coverage={fetcher.last_report['coverage']:.2%} "
+          f"requests={mock.request_count:<6} "
+          f"bytes={mock.bytes_sent / 1e6:.1f}MB 耗时={elapsed:.2f}s 吞吐={len(traces) / elapsed:.1f} traces/sec")
+
+def bench_fetch(args):
+    """
+    对本地 Mock Jaeger 测试不同拉取方式下的吞吐（traces/sec）
+    """
+    end_ts = 1_700_000_300_000_000
+    start_ts = end_ts - 300_000_000
+    mock = MockJaeger(start_ts, end_ts, args.traces, delay_ms=args.delay_ms,
+                      truncate_ratio=args.truncate_ratio, max_page=args.max_page).start()
+    print(f"🧪 Mock Jaeger: {mock.base_url}（{args.traces} 条 traces，延迟 {args.delay_ms}ms）")
+
+    try:
+        for from_search in (False, True):
+            for concurrency in args.concurrency:
+                _run_fetch(mock, start_ts, end_ts, limit=args.limit,
+                           from_search=from_search, concurrency=concurrency)
+        for shards in args.shards:
+            _run_fetch(mock, start_ts, end_ts, limit=args.limit, shards=shards)
+        if args.max_page:
+            # 服务端每页上限小于 limit 时，不告诉 fetcher（server_limit=None）就检测不到饱和窗口
+            for server_limit in (None, args.max_page):
+                _run_fetch(mock, start_ts, end_ts, limit=args.limit, transport="otlp", server_limit=server_limit)
+    finally:
+        mock.stop()
+
+def _best_of(repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - begin)
+    return best
+
+def bench_transport(args):
+    """
+    比较同一批 traces 在 Jaeger JSON 和 OTLP protobuf 两种编码下的传输字节数与解码耗时
+    """
+    rng = random.Random(0)
+    start_ts = 1_700_000_000_000_000
+    traces = [make_trace(rng, start_ts + i * 1000) for i in range(args.traces)]
+
+    json_body = json.dumps({"data": traces}).encode()
+    proto_body = to_otlp_proto(traces)
+
+    def decode_json():
+        return [Trace({"data": [t]}) for t in json.loads(json_body)["data"]]
+
+    def decode_otlp():
+        return [Trace({"data": [t]}) for t in parse_traces(proto_body)]
+
+    assert len(decode_json()) == len(decode_otlp()) == args.traces
+    json_time = _best_of(args.repeat, decode_json)
+    otlp_time = _best_of(args.repeat, decode_otlp)
+    print(f"📊 {args.traces} 条 traces")
+    print(f"   JSON : {len(json_body) / 1e6:8.2f} MB  解码 {json_time:.3f}s  ({args.traces / json_time:.0f} traces/sec)")
+    print(f"   OTLP : {len(proto_body) / 1e6:8.2f} MB  解码 {otlp_time:.3f}s  ({args.traces / otlp_time:.0f} traces/sec)")
+    print(f"   字节数 {len(proto_body) / len(json_body):.1%}，解码耗时 {otlp_time / json_time:.1%}")
+
+def _load_model(path):
+    # 把旧版本的 trace_model.py 作为独立模块加载，pickle 通过 sys.modules 找到其中的类
+    spec = importlib.util.spec_from_file_location("trace_model_baseline", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def _measure_model(name, trace_cls, wrappers):
+    blob = pickle.dumps([trace_cls(w) for w in wrappers], protocol=pickle.HIGHEST_PROTOCOL)
+    num_spans = sum(len(w["data"][0]["spans"]) for w in wrappers)
+
+    # 和读取 trace_data.pkl.gz 一样，测量从 pickle 反序列化出全部对象后占用的内存
+    tracemalloc.start()
+    begin = time.perf_counter()
+    traces = pickle.loads(blob)
+    elapsed = time.perf_counter() - begin
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traces
+
+    print(f"   {name:<8}: {used / num_spans:7.1f} bytes/span  内存 {used / 1e6:8.1f} MB  "
+          f"pickle {len(blob) / 1e6:7.1f} MB  加载 {elapsed:.2f}s")
+    return used
+
+def bench_memory(args):
+    """
+    测量 Trace/Span 对象模型加载后每个 span 占用的内存，可以和旧版本的 trace_model.py 对比
+    """
+    rng = random.Random(0)
+    start_ts = 1_700_000_000_000_000
+    wrappers = [{"data": [make_trace(rng, start_ts + i * 1000)]} for i in range(args.traces)]
+    num_spans = sum(len(w["data"][0]["spans"]) for w in wrappers)
+    print(f"🧪 {args.traces} 条 traces，{num_spans} 个 spans")
+
+    used = _measure_model("当前", Trace, wrappers)
+    if args.baseline:
+        baseline_used = _measure_model("对比", _load_model(args.baseline).Trace, wrappers)
+        print(f"   内存占用为对比版本的 {used / baseline_used:.1%}")
+
+def bench_spantable(args):
+    """
+    比较逐个遍历 Trace/Span 对象与 SpanTable 向量化计算同一组统计量的耗时
+    """
+    rng = random.Random(0)
+    start_ts = 1_700_000_000_000_000
+    traces = [Trace({"data": [make_trace(rng, start_ts + i * 1000)]}) for i in range(args.traces)]
+
+    begin = time.perf_counter()
+    table = SpanTable.from_traces(traces)
+    convert_time = time.perf_counter() - begin
+    print(f"🧪 {table.num_traces} 条 traces，{len(table)} 个 spans，转换为 SpanTable 耗时 {convert_time:.2f}s")
+
+    def loop_stats():
+        durations = [t.total_duration for t in traces]
+        roots = sum(len(t.root_spans) for t in traces)
+        latencies = [c.start_time - s.start_time for t in traces for s in t.spans for c in s.children]
+        pods = Counter(s.pod_id for t in traces for s in t.spans)
+        return durations, roots, latencies, pods
+
+    def table_stats():
+        return table.total_durations(), len(table.root_rows()), table.edge_latencies(), table.pod_counts()
+
+    loop_time = _best_of(args.repeat, loop_stats)
+    table_time = _best_of(args.repeat, table_stats)
+    print(f"   Trace 对象 : {loop_time:.3f}s")
+    print(f"   SpanTable  : {table_time:.3f}s（{loop_time / table_time:.1f}x）")
+
+def bench_lazy(args):
+    """
+    只需要 total_duration / start_time 时，比较普通 Trace 与惰性 Trace 的构造和加载耗时
+    """
+    rng = random.Random(0)
+    start_ts = 1_700_000_000_000_000
+    wrappers = [{"data": [make_trace(rng, start_ts + i * 1000)]} for i in range(args.traces)]
+
+    def summary(traces):
+        return [(t.start_time, t.total_duration) for t in traces]
+
+    eager_time = _best_of(args.repeat, lambda: summary([Trace(w) for w in wrappers]))
+    lazy_time = _best_of(args.repeat, lambda: summary([Trace(w, lazy=True) for w in wrappers]))
+    print(f"🧪 {args.traces} 条 traces")
+    print(f"   从 JSON 构造 : 普通 {eager_time:.3f}s  惰性 {lazy_time:.3f}s（{eager_time / lazy_time:.1f}x）")
+
+    eager_blob = pickle.dumps([Trace(w) for w in wrappers], protocol=pickle.HIGHEST_PROTOCOL)
+    packed_blob = pickle.dumps([Trace(w, lazy=True).pack() for w in wrappers], protocol=pickle.HIGHEST_PROTOCOL)
+    eager_time = _best_of(args.repeat, lambda: summary(pickle.loads(eager_blob)))
+    lazy_time = _best_of(args.repeat, lambda: summary(pickle.loads(packed_blob)))
+    print(f"   从 pickle 加载: 普通 {eager_time:.3f}s  惰性 {lazy_time:.3f}s（{eager_time / lazy_time:.1f}x）  "
+          f"pickle {len(eager_blob) / 1e6:.1f}MB / {len(packed_blob) / 1e6:.1f}MB")
+
+def bench_decode(args):
+    """
+    比较 Jaeger JSON 响应解码成 Trace 的吞吐（MB/s）：json / orjson + Trace 构造，以及 msgspec 类型化解码
+    """
+    rng = random.Random(0)
+    start_ts = 1_700_000_000_000_000
+    body = json.dumps({"data": [make_trace(rng, start_ts + i * 1000) for i in range(args.traces)]}).encode()
+    size_mb = len(body) / 1e6
+    print(f"🧪 {args.traces} 条 traces，响应 {size_mb:.1f} MB")
+
+    decoders = [("json + Trace", lambda: [Trace({"data": [t]}) for t in json.loads(body)["data"]])]
+    if jaeger_decode.orjson is not None:
+        decoders.append(("orjson + Trace", lambda: [Trace({"data": [t]}) for t in jaeger_decode.orjson.loads(body)["data"]]))
+    if jaeger_decode.msgspec is not None:
+        decoders.append(("msgspec", lambda: jaeger_decode.decode_traces(body)))
+        decoders.append(("msgspec 惰性", lambda: jaeger_decode.decode_traces(body, lazy=True)))
+
+    baseline = None
+    for name, decode in decoders:
+        elapsed = _best_of(args.repeat, decode)
+        baseline = baseline or elapsed
+        print(f"   {name:<15}: {size_mb / elapsed:7.1f} MB/s  {elapsed:.3f}s（{baseline / elapsed:.1f}x）")
+
+def bench_parallel(args):
+    """
+    把合成的 trace 写成若干个 [{"data": [trace]}, ...] JSON 分片，比较不同进程数下加载成 SpanTable 的耗时
+    """
+    rng = random.Random(0)
+    start_ts = 1_700_000_000_000_000
+    per_shard = max(1, args.traces // args.shards)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for shard in range(args.shards):
+            wrappers = [{"data": [make_trace(rng, start_ts + (shard * per_shard + i) * 1000)]} for i in range(per_shard)]
+            paths.append(os.path.join(tmp_dir, f"shard_{shard}.json"))
+            with open(paths[-1], "w") as f:
+                json.dump(wrappers, f)
+        size_mb = sum(os.path.getsize(path) for path in paths) / 1e6
+        print(f"🧪 {per_shard * args.shards} 条 traces，{args.shards} 个分片共 {size_mb:.1f} MB，CPU 核数 {os.cpu_count()}")
+
+        baseline = None
+        for workers in args.workers:
+            elapsed = _best_of(args.repeat, lambda: parallel_loader.load_table(paths, workers))
+            baseline = baseline or elapsed
+            print(f"   {workers:>3} 个进程: {elapsed:.3f}s  {size_mb / elapsed:7.1f} MB/s（{baseline / elapsed:.1f}x）")
+
+def bench_store(args):
+    """
+    比较 gzip pickle 的 Trace 列表与 span_store（Parquet）的文件大小和加载耗时
+    """
+    rng = random.Random(0)
+    start_ts = 1_700_000_000_000_000
+    traces = [Trace({"data": [make_trace(rng, start_ts + i * 1000)]}) for i in range(args.traces)]
+    with tempfile.TemporaryDirectory() as experiment_dir:
+        pickle_path = os.path.join(experiment_dir, "trace_data.pkl.gz")
+        with gzip.open(pickle_path, "wb") as f:
+            pickle.dump(traces, f)
+        writer = span_store.SpanStoreWriter(experiment_dir, "algo")
+        with contextlib.redirect_stdout(io.StringIO()):
+            writer.write(SpanTable.from_traces(traces))
+            writer.close()
+        print(f"🧪 {args.traces} 条 traces，pickle {os.path.getsize(pickle_path) / 1e6:.1f}MB，"
+              f"parquet {os.path.getsize(writer.path) / 1e6:.1f}MB")
+
+        def load_pickle():
+            with gzip.open(pickle_path, "rb") as f:
+                return SpanTable.from_traces(pickle.load(f))
+
+        pickle_time = _best_of(args.repeat, load_pickle)
+        store_time = _best_of(args.repeat, lambda: span_store.load_span_table(experiment_dir, "algo"))
+        column_time = _best_of(args.repeat, lambda: span_store.read_spans(experiment_dir, columns=["service", "duration"]))
+        print(f"   pickle -> SpanTable : {pickle_time:.3f}s")
+        print(f"   parquet -> SpanTable: {store_time:.3f}s（{pickle_time / store_time:.1f}x）")
+        print(f"   parquet 只读两列    : {column_time:.3f}s（{pickle_time / column_time:.1f}x）")
+
+def bench_mmap(args):
+    """
+    把同一批合成 trace 重复写入 span_mmap，得到不同规模的数据，比较 CDF / pod 计数 / 时间窗口统计的耗时和
+    NumPy 分配的内存峰值（tracemalloc，不含 memmap 映射的页缓存），峰值应与 span 数无关
+    """
+    rng = random.Random(0)
+    start_ts = 1_700_000_000_000_000
+    table = SpanTable.from_traces(Trace({"data": [make_trace(rng, start_ts + i * 1000)]}) for i in range(args.traces))
+    window = (start_ts, start_ts + args.traces * 500)
+    with tempfile.TemporaryDirectory() as experiment_dir:
+        for repeat in args.repeats:
+            writer = span_mmap.SpanMmapWriter(experiment_dir, f"x{repeat}")
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(repeat):
+                    writer.write(table)
+                writer.close()
+            spans = span_mmap.SpanMmap(writer.folder)
+
+            tracemalloc.start()
+            begin = time.perf_counter()
+            spans.duration_cdf()
+            spans.counts("pod")
+            spans.counts("service", *window)
+            spans.duration_histogram(np.geomspace(1, 1e7, 100), "span", *window)
+            elapsed = time.perf_counter() - begin
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"🧪 {len(spans) / 1e6:6.1f}M span: {elapsed:.2f}s（{len(spans) / elapsed / 1e6:.1f}M span/s），"
+                  f"内存峰值 {peak / 1e6:.1f}MB")
+
+def bench_split(args):
+    """
+    按 K 个算法时间窗口拆分 trace_results.json：逐窗口 json.load 再扫描（原先的做法）与 ijson 单遍拆分的耗时
+    """
+    rng = random.Random(0)
+    start_ts = 1_700_000_000_000_000
+    step = 10_000
+    wrappers = [{"data": [make_trace(rng, start_ts + i * step)]} for i in range(args.traces)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trace_file = os.path.join(tmp_dir, "trace_results.json")
+        with open(trace_file, "w") as f:
+            json.dump(wrappers, f)
+        print(f"🧪 {args.traces} 条 traces，{os.path.getsize(trace_file) / 1e6:.1f} MB")
+
+        for k in args.windows:
+            width = args.traces * step // k
+            windows = [(start_ts + i * width, start_ts + (i + 1) * width - 1, os.path.join(tmp_dir, f"w{k}_{i}"))
+                       for i in range(k)]
+
+            def per_window():
+                for window_start, window_end, _ in windows:
+                    with open(trace_file) as f:
+                        traces = json.load(f)
+                    [t for t in traces if any(window_start <= s["startTime"] <= window_end for s in t["data"][0]["spans"])]
+
+            def single_pass():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    process_trace.split_traces_by_windows(trace_file, windows)
+
+            per_window_time = _best_of(1, per_window)
+            single_time = _best_of(1, single_pass)
+            print(f"   {k:>2} 个窗口: 逐窗口解析 {per_window_time:.2f}s（不含写出）  单遍拆分 {single_time:.2f}s（含写出）")
+
+def bench_range(args):
+    """
+    在按分钟分区的 trace_chunks 上做时间范围查询：全量扫描过滤与按稀疏索引只读重叠 chunk 的耗时
+    """
+    rng = random.Random(0)
+    start_ts = 1_700_000_000_000_000
+    step = args.minutes * 60_000_000 // args.traces
+    traces = [Trace({"data": [make_trace(rng, start_ts + i * step)]}, lazy=True).pack() for i in range(args.traces)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        writer = TraceChunkWriter(tmp_dir, args.chunk_size)
+        with contextlib.redirect_stdout(io.StringIO()):
+            writer.extend(traces)
+            writer.close()
+        chunks = TraceChunks(tmp_dir)
+        print(f"🧪 {args.traces} 条 traces，{args.minutes} 分钟，{len(chunks.index['chunks'])} 个 chunk")
+
+        for window_minutes in args.windows:
+            begin = start_ts + (args.minutes - window_minutes) * 30_000_000
+            end = begin + window_minutes * 60_000_000
+
+            def scan():
+                return sum(1 for t in chunks if begin <= t.start_time < end)
+
+            def query():
+                return sum(1 for _ in chunks.query(begin, end))
+
+            scan_time = _best_of(args.repeat, scan)
+            query_time = _best_of(args.repeat, query)
+            print(f"   {window_minutes:>3} 分钟窗口: 全量扫描 {scan_time:.3f}s  索引查询 {query_time:.3f}s"
+                  f"（{len(chunks.blocks(begin, end))} 个 chunk，{scan_time / query_time:.1f}x）")
+
+def main():
+    parser = argparse.ArgumentParser(description="trace 处理链路的性能基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fetch = sub.add_parser("fetch", help="JaegerDataFetcher 拉取吞吐")
+    fetch.add_argument("--traces", type=int, default=3000, help="合成 trace 数量")
+    fetch.add_argument("--limit", type=int, default=1000, help="每页 trace 数")
+    fetch.add_argument("--delay-ms", type=float, default=5.0, help="每个请求的模拟网络延迟（毫秒）")
+    fetch.add_argument("--truncate-ratio", type=float, default=0.02, help="搜索结果中被截断的 trace 比例")
+    fetch.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    fetch.add_argument("--shards", type=int, nargs="+", default=[1, 4, 16], help="时间窗口分片数")
+    fetch.add_argument("--max-page", type=int, default=None, help="Mock Jaeger 每页最多返回的 trace 数（服务端上限）")
+    fetch.set_defaults(func=bench_fetch)
+
+    transport = sub.add_parser("transport", help="JSON 与 OTLP protobuf 的传输字节数和解码耗时")
+    transport.add_argument("--traces", type=int, default=5000, help="合成 trace 数量")
+    transport.add_argument("--repeat", type=int, default=3, help="重复次数，取最快一次")
+    transport.set_defaults(func=bench_transport)
+
+    memory = sub.add_parser("memory", help="Trace/Span 对象模型每个 span 的内存占用")
+    memory.add_argument("--traces", type=int, default=20000, help="合成 trace 数量")
+    memory.add_argument("--baseline", default=None,
+                        help="用于对比的旧版 trace_model.py，例如 git show <rev>:./trace_model.py > /tmp/old_model.py")
+    memory.set_defaults(func=bench_memory)
+
+    spantable = sub.add_parser("spantable", help="Trace 对象遍历与 SpanTable 向量化统计的耗时")
+    spantable.add_argument("--traces", type=int, default=100000, help="合成 trace 数量")
+    spantable.add_argument("--repeat", type=int, default=3, help="重复次数，取最快一次")
+    spantable.set_defaults(func=bench_spantable)
+
+    lazy = sub.add_parser("lazy", help="只读取 trace 摘要时普通 Trace 与惰性 Trace 的耗时")
+    lazy.add_argument("--traces", type=int, default=20000, help="合成 trace 数量")
+    lazy.add_argument("--repeat", type=int, default=3, help="重复次数，取最快一次")
+    lazy.set_defaults(func=bench_lazy)
+
+    decode = sub.add_parser("decode", help="Jaeger JSON 响应解码成 Trace 的吞吐")
+    decode.add_argument("--traces", type=int, default=5000, help="合成 trace 数量")
+    decode.add_argument("--repeat", type=int, default=3, help="重复次数，取最快一次")
+    decode.set_defaults(func=bench_decode)
+
+    parallel = sub.add_parser("parallel", help="多进程加载 trace 文件成 SpanTable 的耗时")
+    parallel.add_argument("--traces", type=int, default=40000, help="合成 trace 数量")
+    parallel.add_argument("--shards", type=int, default=16, help="分片文件数")
+    parallel.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parallel.add_argument("--repeat", type=int, default=1, help="重复次数，取最快一次")
+    parallel.set_defaults(func=bench_parallel)
+
+    store = sub.add_parser("store", help="gzip pickle 与 Parquet span_store 的大小和加载耗时")
+    store.add_argument("--traces", type=int, default=20000, help="合成 trace 数量")
+    store.add_argument("--repeat", type=int, default=3, help="重复次数，取最快一次")
+    store.set_defaults(func=bench_store)
+
+    mmap = sub.add_parser("mmap", help="span_mmap 分块统计的耗时与内存峰值")
+    mmap.add_argument("--traces", type=int, default=20000, help="每批合成 trace 数量")
+    mmap.add_argument("--repeats", type=int, nargs="+", default=[5, 50], help="每种规模重复写入的批数")
+    mmap.set_defaults(func=bench_mmap)
+
+    split = sub.add_parser("split", help="按多个时间窗口拆分 trace_results.json 的耗时")
+    split.add_argument("--traces", type=int, default=10000, help="合成 trace 数量")
+    split.add_argument("--windows", type=int, nargs="+", default=[1, 4, 16], help="时间窗口（算法）数")
+    split.set_defaults(func=bench_split)
+
+    range_query = sub.add_parser("range", help="按时间分区的 trace_chunks 上时间范围查询的耗时")
+    range_query.add_argument("--traces", type=int, default=60000, help="合成 trace 数量")
+    range_query.add_argument("--minutes", type=int, default=60, help="trace 开始时间覆盖的分钟数")
+    range_query.add_argument("--chunk-size", type=int, default=10000, help="每个 chunk 的最大 trace 数")
+    range_query.add_argument("--windows", type=int, nargs="+", default=[1, 5, 30], help="查询窗口（分钟）")
+    range_query.add_argument("--repeat", type=int, default=3, help="重复次数，取最快一次")
+    range_query.set_defaults(func=bench_range)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import random
+
+import numpy as np
+
+from mock_jaeger import make_trace
+from trace_model import Trace, SpanTable
+from utils import tail_percentiles
+
+# 向量化实现与逐个对象的参考实现对照检查，改动 trace_model / utils 之后运行：python checks.py
+
+def _span(span_id, parent_id, start, duration, service="svc"):
+    return {"spanID": span_id, "references": [{"spanID": parent_id}] if parent_id else [],
+            "startTime": start, "duration": duration, "processID": "p1", "operationName": service, "tags": []}
+
+def _trace(trace_id, spans):
+    return Trace({"data": [{"traceID": trace_id, "spans": spans,
+                            "processes": {"p1": {"serviceName": "svc"}}}]})
+
+def _skew(rng, trace_json):
+    # 把部分子 span 挪到父 span 结束之后开始（FOLLOWS_FROM 或时钟偏差），或者提前到父 span 开始之前
+    spans = {span["spanID"]: span for span in trace_json["spans"]}
+    for span in trace_json["spans"]:
+        parent = spans.get(span["references"][0]["spanID"]) if span["references"] else None
+        if parent is None or rng.random() > 0.3:
+            continue
+        if rng.random() < 0.7:
+            span["startTime"] = parent["startTime"] + parent["duration"] + rng.randint(0, 5000)
+        else:
+            span["startTime"] = parent["startTime"] - rng.randint(1, 5000)
+    return trace_json
+
+def check_self_times(traces=2000, seed=0):
+    """
+    SpanTable.self_times 与 Span.self_time 逐个比较，包括父 span 结束后才开始、父 span 开始前就开始的子 span
+    """
+    rng = random.Random(seed)
+    start_ts = 1_700_000_000_000_000
+    # 手写的用例单独成表：组偏移取决于整张表的最大 duration，混进长 trace 后越界的子 span 碰不到下一组
+    handmade = [
+        # 第一个父 span 的子 span 在它结束后才开始，不能影响第二个父 span：[0,100] 内的子 span [10,50] 自身耗时为 60
+        _trace("late", [_span("a", None, 0, 100), _span("a1", "a", 500, 50),
+                        _span("b", None, 0, 100), _span("b1", "b", 10, 40)]),
+        _trace("early", [_span("a", None, 1000, 100), _span("a1", "a", 0, 50), _span("a2", "a", 900, 150)]),
+    ]
+    synthetic = [Trace({"data": [_skew(rng, make_trace(rng, start_ts + i * 1000, background=rng.random() < 0.1))]})
+                 for i in range(traces)]
+
+    spans = 0
+    for cases in (handmade, synthetic):
+        table = SpanTable.from_traces(cases)
+        expected = [span.self_time for trace in table.to_traces() for span in trace.spans]
+        actual = table.self_times().tolist()
+        mismatches = [row for row, (a, b) in enumerate(zip(actual, expected)) if a != b]
+        assert not mismatches, f"self_times 与 Span.self_time 不一致的行：{mismatches[:10]}"
+        spans += len(table)
+    print(f"✅ self_times：{spans} 个 span 与 Span.self_time 一致")
+
+def check_critical_path(traces=3000, seed=0, depth=3000):
+    """
+    Trace.critical_path 的各段之和等于根 span 的耗时且都在根 span 区间内，SpanTable.critical_path_times
+    与按 span 汇总的 Trace.critical_path 一致；包括早于父 span 开始就结束的子 span 和很深的调用链
+    """
+    rng = random.Random(seed)
+    start_ts = 1_700_000_000_000_000
+    chain = [_span("s0", None, 0, depth * 10)] + [_span(f"s{i}", f"s{i - 1}", i, depth * 10 - 2 * i)
+                                                 for i in range(1, depth)]
+    cases = [
+        # 根 [1000, 1100] 的子 span [0, 50] 在根开始前就结束，关键路径只有根自身的 100
+        _trace("before", [_span("a", None, 1000, 100), _span("a1", "a", 0, 50)]),
+        _trace("straddle", [_span("a", None, 1000, 100), _span("a1", "a", 900, 150), _span("a2", "a", 1090, 500)]),
+        _trace("chain", chain),
+    ]
+    cases += [Trace({"data": [_skew(rng, make_trace(rng, start_ts + i * 1000, background=rng.random() < 0.1))]})
+              for i in range(traces)]
+
+    table = SpanTable.from_traces(cases)
+    expected = []
+    for trace in table.to_traces():
+        root = max(trace.root_spans, key=lambda s: s.end_time)
+        segments = trace.critical_path()
+        assert sum(end - begin for _, begin, end in segments) == root.duration, trace.trace_id
+        assert all(root.start_time <= begin < end <= root.end_time for _, begin, end in segments), trace.trace_id
+        per_span = {}
+        for span, begin, end in segments:
+            per_span[span.span_id] = per_span.get(span.span_id, 0) + end - begin
+        expected.extend(per_span.get(span.span_id, 0) for span in trace.spans)
+
+    actual = table.critical_path_times().tolist()
+    mismatches = [row for row, (a, b) in enumerate(zip(actual, expected)) if a != b]
+    assert not mismatches, f"critical_path_times 与 Trace.critical_path 不一致的行：{mismatches[:10]}"
+    print(f"✅ critical_path：{table.num_traces} 条 trace 的关键路径之和等于根 span 耗时，SpanTable 结果一致")
+
+def check_tail_percentiles(seed=0):
+    """
+    tail_percentiles 与 np.quantile(..., method="inverted_cdf") 比较：样本只保留总体中最慢的一部分，
+    样本覆盖到的分位数必须完全相同，覆盖不到的为 None
+    """
+    rng = np.random.default_rng(seed)
+    quantiles = (0.5, 0.9, 0.95, 0.99, 0.999, 0.9999)
+    cases = [np.arange(1, n + 1) for n in (1, 7, 100, 1000, 10000, 12345)]
+    cases += [rng.integers(1, 500, size=n) for n in rng.integers(1, 20000, size=50)]  # 有大量重复值
+    for population in cases:
+        ranked = np.sort(population)[::-1]
+        for sample_size in {len(ranked), max(1, len(ranked) // 10), 1}:
+            result = tail_percentiles(ranked[:sample_size].tolist(), len(ranked), quantiles)
+            for q in quantiles:
+                expected = np.quantile(population, q, method="inverted_cdf")
+                context = f"population={len(ranked)} sample={sample_size} q={q}"
+                if result[q] is None:
+                    # 只有分位数落在样本之外时才允许为 None
+                    assert sample_size < len(ranked) and expected <= ranked[sample_size - 1], context
+                else:
+                    assert result[q] == expected, f"{context}: {result[q]} != {expected}"
+    print(f"✅ tail_percentiles：{len(cases)} 组总体与 np.quantile 一致")
+
+CHECKS = {
+    "self_times": check_self_times,
+    "critical_path": check_critical_path,
+    "tail_percentiles": check_tail_percentiles,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="向量化统计与参考实现的对照检查")
+    parser.add_argument("names", nargs="*", help=f"只运行这些检查，默认全部：{', '.join(CHECKS)}")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(CHECKS)
+    if unknown:
+        parser.error(f"未知的检查：{', '.join(sorted(unknown))}")
+    for name in args.names or CHECKS:
+        CHECKS[name]()
@@ -10,6 +10,17 @@ parser.add_argument("--policy", default="LEAST_REQUEST", help="负载均衡策
 parser.add_argument("--all-algo", action="store_true", help="为所有策略生成 YAML （覆盖 --policy）")
 parser.add_argument("--interval", type=int, default=1)
 parser.add_argument('--num_experiments', type=int, default=1, help='Number of recent experiments to process')
+parser.add_argument("--fetch-concurrency", type=int, default=8, help="并发拉取 Jaeger trace 的线程数")
+parser.add_argument("--fetch-shards", type=int, default=4, help="把拉取时间范围切成多少个子窗口并行拉取")
+parser.add_argument("--chunk-size", type=int, default=10000, help="流式拉取时每个 trace chunk 文件的条数（0 表示全部拉取后保存为单个 pkl.gz）")
+parser.add_argument("--tail-traces", action="store_true", help="策略运行期间在后台实时拉取 traces（需要 --chunk-size > 0）")
+parser.add_argument("--tail-interval", type=int, default=5, help="实时拉取的轮询间隔（秒）")
+parser.add_argument("--refetch-traces", action="store_true", help="忽略搜索结果中的 spans，逐条按 traceID 重新拉取")
+parser.add_argument("--jaeger-cache-dir", default=None, help="Jaeger 查询结果的本地缓存目录（默认不缓存）")
+parser.add_argument("--trace-min-duration", default=None, help="只拉取耗时不小于该值的 traces（如 100ms），用于尾延迟分析")
+parser.add_argument("--trace-transport", choices=["json", "otlp"], default="json", help="Jaeger 查询接口：json 或 api_v3 OTLP protobuf")
+parser.add_argument("--all-services", action="store_true", help="以应用的所有服务为入口并行拉取 traces（包括不经过根服务的调用），跨服务去重并拼接不完整的 trace")
+parser.add_argument("--otlp-port", type=int, default=0, help="启动进程内 OTLP/HTTP 接收器的端口，直接接收网格上报的 spans（0 表示不启用，从 Jaeger 拉取）")
 parser.add_argument("--replicas", type=int, default=-1, help="Number of replicas to set (default: -1 means do not change numbers of replicas).")
 
 args = parser.parse_args()
@@ -6,12 +6,28 @@ import os
 import gzip
 import pickle
 from trace_model import Trace
+from trace_store import TraceChunks, has_chunks
+import span_store
+import span_mmap
 import utils
 
-def load_trace_data_from_dir(algo_dir: str) -> list:
+def load_trace_data_from_dir(algo_dir: str, start_time: int = None, end_time: int = None) -> list:
     """
-    从某个算法目录加载 trace_data.pkl.gz 文件，并构造 Trace 对象列表
+    从某个算法目录加载 trace_data.pkl.gz 文件，并构造 Trace 对象列表。
+    实验目录下的 span_store 中有该算法时直接从 Parquet 读取（得到惰性 Trace）；
+    如果目录下有流式拉取写出的 trace_chunks，则返回按 chunk 惰性迭代的视图
+    给出 start_time / end_time 时只加载开始时间在 [start_time, end_time) 内的 trace（微秒），
+    span_store 和 trace_chunks 只读取与该范围重叠的部分，用于去掉预热阶段、放大查看某段时间
     """
+    experiment_dir, algo = os.path.split(os.path.normpath(algo_dir))
+    ranged = start_time is not None or end_time is not None
+    if span_store.has_algo(experiment_dir, algo):
+        return span_store.load_span_table(experiment_dir, algo, start_time, end_time).to_traces(lazy=True)
+
+    if has_chunks(algo_dir):
+        chunks = TraceChunks(algo_dir)
+        return list(chunks.query(start_time, end_time)) if ranged else chunks
+
     trace_file = os.path.join(algo_dir, "trace_data.pkl.gz")
     if not os.path.isfile(trace_file):
         print(f"❌ 找不到 trace_data.pkl.gz: {trace_file}")
@@ -20,19 +36,26 @@ def load_trace_data_from_dir(algo_dir: str) -> list:
     with gzip.open(trace_file, "rb") as f:
         trace_data = pickle.load(f)
 
+    if ranged:
+        trace_data = [trace for trace in trace_data
+                      if (start_time is None or trace.start_time >= start_time)
+                      and (end_time is None or trace.start_time < end_time)]
     return trace_data
 
 def load_all_traces_from_experiment(experiment_dir: str) -> dict:
     """
     遍历 experiment_dir 下所有子目录（每个子目录是一个算法名），
-    使用函数2加载每个子目录的数据，返回 dict：{algo_name: List[Trace]}
+    使用函数2加载每个子目录的数据，返回 dict：{algo_name: List[Trace]}。
+    已转换到 span_store 的算法即使原目录已删除也会加载
     """
     algo_trace_dict = {}
 
-    for algo in os.listdir(experiment_dir):
+    algos = set(span_store.list_algos(experiment_dir))
+    algos.update(name for name in os.listdir(experiment_dir)
+                 if name not in (span_store.STORE_DIR, span_mmap.MMAP_DIR)
+                 and os.path.isdir(os.path.join(experiment_dir, name)))
+    for algo in sorted(algos):
         algo_path = os.path.join(experiment_dir, algo)
-        if not os.path.isdir(algo_path):
-            continue
 
         traces = load_trace_data_from_dir(algo_path)
         if traces:
@@ -45,13 +45,15 @@ class TraceCategorizer:
         self.trace_categories = defaultdict(list)
 
     def categorize_traces(self, trace_objects):
+        # 按服务集合分类，同一服务集合下再按调用结构（Trace.shape）区分，不同请求路径不会混在一起
         for trace in trace_objects:
-            services = set(span.service_name for span in trace.spans)
-            timestamp = trace.spans[0].start_time if trace.spans else None
-            total_duration = trace.get_total_duration()
+            services = set(trace.service_map.values())
+            # 用 is_empty 判断，惰性 / 打包的 trace 不需要为此解码全部 span
+            timestamp = None if trace.is_empty else trace.start_time
+            total_duration = trace.total_duration
 
             if timestamp is not None:
-                category_key = tuple(sorted(services))
+                category_key = tuple(sorted(services)) + (trace.shape,)
                 self.trace_categories[category_key].append((timestamp, total_duration))
 
         return self.trace_categories
@@ -0,0 +1,127 @@
+import json
+import sys
+from typing import Dict, List, Optional
+
+from trace_model import Trace
+
+try:
+    import msgspec
+except ImportError:  # 可选依赖：pip install msgspec
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # 可选依赖：pip install orjson
+    orjson = None
+
+POD_TAG = "node_id"
+
+def loads(content):
+    """
+    通用 JSON 解码，装了 orjson 时使用 orjson（结果与 json.loads 相同）
+    """
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+if msgspec is not None:
+    # Jaeger /api/traces 响应中 Trace 模型用到的字段；logs、warnings 等未声明的字段解码时直接跳过，
+    # tags 整体保留为原始字节（Raw），只把 node_id 那一个 tag 解码出来
+    class JaegerTag(msgspec.Struct):
+        key: str
+        value: str = ""
+
+    class JaegerReference(msgspec.Struct):
+        spanID: str
+
+    class JaegerSpan(msgspec.Struct):
+        spanID: str
+        startTime: int
+        duration: int
+        processID: str
+        operationName: str = ""
+        references: Optional[List[JaegerReference]] = None
+        tags: msgspec.Raw = msgspec.Raw(b"[]")
+
+    class JaegerProcess(msgspec.Struct):
+        serviceName: str = "unknown"
+
+    class JaegerTrace(msgspec.Struct):
+        traceID: str
+        spans: List[JaegerSpan]
+        processes: Dict[str, JaegerProcess]
+
+    class JaegerResponse(msgspec.Struct):
+        data: Optional[List[JaegerTrace]] = None
+
+    _response_decoder = msgspec.json.Decoder(JaegerResponse)
+    _response_list_decoder = msgspec.json.Decoder(List[JaegerResponse])
+    _tag_decoder = msgspec.json.Decoder(JaegerTag)
+    _tags_decoder = msgspec.json.Decoder(List[dict])
+
+_POD_KEY = f'"{POD_TAG}"'.encode()
+
+def _pod_from_value(value):
+    parts = value.split("~")
+    return parts[2] if len(parts) > 2 else "unknown"
+
+def _pod_from_tags(raw_tags):
+    # 在原始字节里定位 "node_id"，只解码包含它的那个 tag 对象；遇到无法按这种方式切出的情况时完整解码 tags
+    data = bytes(raw_tags)
+    pos = data.find(_POD_KEY)
+    try:
+        while pos >= 0:
+            tag = _tag_decoder.decode(data[data.rfind(b"{", 0, pos):data.find(b"}", pos) + 1])
+            if tag.key == POD_TAG:
+                return _pod_from_value(tag.value)
+            pos = data.find(_POD_KEY, pos + 1)
+        return "unknown"
+    except msgspec.DecodeError:
+        for tag in _tags_decoder.decode(data):
+            if tag.get("key") == POD_TAG:
+                return _pod_from_value(tag["value"])
+        return "unknown"
+
+def _trace_from_struct(trace, lazy):
+    service_map = {pid: sys.intern(process.serviceName) for pid, process in trace.processes.items()}
+    states = [
+        (span.spanID,
+         span.references[0].spanID if span.references else None,
+         span.startTime,
+         span.duration,
+         _pod_from_tags(span.tags),
+         service_map[span.processID],
+         span.operationName)
+        for span in trace.spans
+    ]
+    return Trace.from_span_states(trace.traceID, service_map, states, lazy=lazy)
+
+def decode_traces(content, lazy=False):
+    """
+    把 Jaeger 查询接口的响应（{"data": [trace, ...]}，/api/traces 搜索结果或 /api/traces/{id}）直接解码成 Trace 列表。
+    装了 msgspec 时按上面的 schema 做类型化解码，一次遍历同时取出 pod 和服务名，不生成中间 dict；
+    否则退回到 orjson / json 解码后用 Trace 构造
+    :param content: 响应内容（bytes 或 str）
+    :param lazy: 是否得到打包好的惰性 Trace（见 Trace.pack）
+    """
+    if msgspec is not None:
+        return [_trace_from_struct(trace, lazy) for trace in _response_decoder.decode(content).data or ()]
+
+    traces = [Trace({"data": [trace]}, lazy=lazy) for trace in loads(content).get("data") or []]
+    return [trace.pack() for trace in traces] if lazy else traces
+
+def decode_trace(content, lazy=False):
+    """
+    解码 /api/traces/{id} 的响应，没有数据时返回 None
+    """
+    traces = decode_traces(content, lazy)
+    return traces[0] if traces else None
+
+def decode_trace_list(content, lazy=False):
+    """
+    解码 [{"data": [trace]}, ...] 形式的 JSON（trace_results.json、trace_example.json），得到 Trace 列表
+    """
+    if msgspec is not None:
+        return [_trace_from_struct(trace, lazy)
+                for response in _response_list_decoder.decode(content) for trace in response.data or ()]
+
+    traces = [Trace({"data": [trace]}, lazy=lazy) for wrapper in loads(content) for trace in wrapper.get("data") or []]
+    return [trace.pack() for trace in traces] if lazy else traces
@@ -0,0 +1,146 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import span_store
+from jaeger_decode import decode_trace_list
+from trace_model import SpanTable
+from trace_store import write_json_atomic
+
+MANIFEST = "_manifest.json"
+PARTS_DIR = ".parts"
+SCAN_BLOCK = 1 << 20
+
+# [{"data": [trace]}, ...] 中每一项的开头：前面是 [ 或 ,，紧跟 {"data": 。
+# JSON 字符串里的引号必须转义，所以这个模式不会出现在字符串值中；trace 内部也没有 data 字段
+_ITEM_START = re.compile(rb'[\[,]\s*(\{\s*"data"\s*:)')
+
+def _next_item_start(f, pos):
+    # 从 pos 开始向后找下一项的起始偏移，按块读取；相邻块重叠一段，避免模式被切断
+    overlap = 64
+    while True:
+        f.seek(pos)
+        block = f.read(SCAN_BLOCK)
+        if not block:
+            return None
+        match = _ITEM_START.search(block)
+        if match:
+            return pos + match.start(1)
+        if len(block) < SCAN_BLOCK:
+            return None
+        pos += SCAN_BLOCK - overlap
+
+def find_ranges(path, chunk_bytes):
+    """
+    把 JSON 数组文件按项的边界切成大约 chunk_bytes 大小的字节区间，每个区间包含若干完整的项。
+    只在每个切分点附近读取少量数据，不解析整个文件
+    :return: [(begin, end), ...]
+    """
+    size = os.path.getsize(path)
+    starts = []
+    with open(path, "rb") as f:
+        start = _next_item_start(f, 0)
+        while start is not None:
+            starts.append(start)
+            start = _next_item_start(f, start + chunk_bytes) if start + chunk_bytes < size else None
+    return list(zip(starts, starts[1:] + [size]))
+
+def _read_range(path, begin, end):
+    # 区间以下一项前的 "," 结尾（最后一个区间以 "]" 结尾），去掉后包成一个完整的 JSON 数组
+    with open(path, "rb") as f:
+        f.seek(begin)
+        content = f.read(end - begin).rstrip()
+    if content.endswith(b"]") and end == os.path.getsize(path):
+        content = content[:-1].rstrip()
+    if content.endswith(b","):
+        content = content[:-1]
+    return b"[" + content + b"]"
+
+def _convert_range(path, begin, end, part_path):
+    table = SpanTable.from_traces(decode_trace_list(_read_range(path, begin, end)))
+    tmp_path = f"{part_path}.tmp"
+    span_store.pq.write_table(span_store.to_arrow(table), tmp_path, compression=span_store.COMPRESSION,
+                              row_group_size=span_store.ROW_GROUP_SIZE)
+    os.replace(tmp_path, part_path)
+    return {"traces": table.num_traces, "spans": len(table)}
+
+def _input_signature(path, chunk_bytes):
+    stat = os.stat(path)
+    return {"input": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime, "chunk_bytes": chunk_bytes}
+
+def convert(path, experiment_dir, algo, workers=None, chunk_mb=64):
+    """
+    把 [{"data": [trace]}, ...] 形式的大 JSON 文件并行转换为 span_store 中的一个分区（algo={algo}）。
+    文件按项的边界切成字节区间，每个区间由一个子进程读取、解码并写成一个 Parquet 分片；
+    进度记录在分区目录的 _manifest.json 中，中断后重新运行只转换尚未完成的区间，已完成的部分不会重新解析。
+    全部完成后分片才移入分区目录，读取方不会看到转换到一半的数据
+    :param workers: 进程数，默认为 CPU 核数
+    :param chunk_mb: 每个区间的大致大小（MB）
+    """
+    span_store._require_pyarrow()
+    chunk_bytes = chunk_mb << 20
+    output_dir = span_store.partition_dir(experiment_dir, algo)
+    parts_dir = os.path.join(output_dir, PARTS_DIR)
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    signature = _input_signature(path, chunk_bytes)
+
+    manifest = None
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if {key: manifest.get(key) for key in signature} != signature:
+            print(f"⚠️ 输入文件或区间大小与 {manifest_path} 不一致，重新转换")
+            manifest = None
+    if manifest is None:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.makedirs(parts_dir)
+        start = time.perf_counter()
+        manifest = dict(signature, ranges=find_ranges(path, chunk_bytes), done={})
+        write_json_atomic(manifest_path, manifest)
+        print(f"✂️ 按项边界切分为 {len(manifest['ranges'])} 个区间，耗时 {time.perf_counter() - start:.2f}s")
+
+    def part_path(i):
+        return os.path.join(parts_dir, span_store.PART_FILE.format(i))
+
+    def final_path(i):
+        return os.path.join(output_dir, span_store.PART_FILE.format(i))
+
+    pending = [i for i in range(len(manifest["ranges"]))
+               if str(i) not in manifest["done"] or not (os.path.isfile(part_path(i)) or os.path.isfile(final_path(i)))]
+    if len(pending) < len(manifest["ranges"]):
+        print(f"⏭️ 跳过已完成的 {len(manifest['ranges']) - len(pending)} 个区间")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = {pool.submit(_convert_range, path, *manifest["ranges"][i], part_path(i)): i for i in pending}
+            for future in as_completed(futures):
+                i = futures[future]
+                manifest["done"][str(i)] = future.result()
+                write_json_atomic(manifest_path, manifest)
+                print(f"✅ 区间 {i}: {manifest['done'][str(i)]['traces']} 条 traces"
+                      f"（{len(manifest['done'])}/{len(manifest['ranges'])}）")
+
+    # 全部完成后移入分区目录；part-00000 最后移入，它存在即表示分区完整（见 span_store.list_algos）
+    for i in sorted(range(len(manifest["ranges"])), reverse=True):
+        if os.path.isfile(part_path(i)):
+            os.replace(part_path(i), final_path(i))
+    traces = sum(entry["traces"] for entry in manifest["done"].values())
+    spans = sum(entry["spans"] for entry in manifest["done"].values())
+    print(f"🎉 {traces} 条 traces（{spans} 个 span）已写入 {output_dir}")
+    return manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把 [{\"data\": [trace]}, ...] 形式的 JSON 并行转换为 span_store，可断点续传")
+    parser.add_argument("input", help="JSON 文件，例如 data/onlineBoutique/<实验>/trace_results.json")
+    parser.add_argument("--experiment-dir", default=None, help="写入哪个实验目录的 span_store，默认为输入文件所在目录")
+    parser.add_argument("--algo", default="all", help="span_store 中的分区名")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为 CPU 核数")
+    parser.add_argument("--chunk-mb", type=int, default=64, help="每个区间的大致大小（MB）")
+    args = parser.parse_args()
+
+    convert(args.input, args.experiment_dir or os.path.dirname(os.path.abspath(args.input)), args.algo,
+            args.workers, args.chunk_mb)
@@ -13,7 +13,7 @@ from JaegerDataFetcher import JaegerDataFetcher
 from app_launcher import deploy
 from generate_destination_rules import generate_yaml
 from process_metrics import process_all_metrics
-from process_trace import split_traces_by_time
+from process_trace import split_traces_by_windows
 from utils import wait_for_pods_ready, apply_algo_yaml, utc_microtime, sleep_with_progress_bar, read_timestamps
 
 def main():
@@ -106,9 +106,7 @@ def main():
 
     # 8. 拆分和保存 Jaeger 数据
     trace_file = os.path.join(experiment_dir, "trace_results.json")
-    for start_ts, end_ts, algo_dir in timestamps:
-        print(start_ts, end_ts)
-        split_traces_by_time(trace_file, start_ts, end_ts, algo_dir)
+    split_traces_by_windows(trace_file, timestamps)
 
     # 9. 处理所有收集到的数据
     process_all_metrics(args.app, experiment_id)
@@ -7,20 +7,23 @@ import yaml
 from config import args
 import draw_metrics
 import draw_duration
+import trace_analysis
 from constants import ALGO_LIST, APP_SERVICE_NAME_MAP, APP_YAML_MAP
-from JaegerDataFetcher import JaegerDataFetcher
+from JaegerDataFetcher import JaegerDataFetcher, MultiServiceFetcher, TailHarvester
 from app_launcher import deploy, remove
 import generate_destination_rules
 from process_metrics import process_all_metrics
 from process_trace import split_traces_by_time
 from utils import wait_for_pods_ready, wait_for_pods_cleanup, apply_algo_yaml, utc_microtime, sleep_with_progress_bar, read_timestamps
 from kube_metrics_fetcher import MetricsCollector  # 线程采集器
+from otlp_receiver import OtlpReceiver
 
-def run_algo(algo, experiment_dir):
+def run_algo(algo, experiment_dir, receiver=None):
     algo_dir = os.path.join(experiment_dir, algo)
     os.makedirs(algo_dir, exist_ok=True)
 
     collector = None
+    tail = None
 
     try:
         # 1. 部署应用
@@ -42,14 +45,35 @@ def run_algo(algo, experiment_dir):
         collector = MetricsCollector(args.namespace, args.interval, metrics_file)
         collector.start()
 
-        # 5. 策略运行
+        # 5. 策略运行（开启 --tail-traces 时同时在后台实时拉取 traces）
+        fetcher_kwargs = dict(concurrency=args.fetch_concurrency,
+                              from_search=not args.refetch_traces,
+                              shards=args.fetch_shards,
+                              cache_dir=args.jaeger_cache_dir,
+                              min_duration=args.trace_min_duration,
+                              transport=args.trace_transport)
+        if args.all_services:
+            services = [f"{svc}.{args.namespace}" for svc in generate_destination_rules.get_services_from_yaml(args.app)]
+            jaeger_fetcher = MultiServiceFetcher(services, **fetcher_kwargs)
+        else:
+            jaeger_fetcher = JaegerDataFetcher(f"{APP_SERVICE_NAME_MAP[args.app]}.{args.namespace}", **fetcher_kwargs)
         start_ts = utc_microtime()
         print(f"🕒 开始时间: {start_ts}")
 
+        if receiver:
+            receiver.start_run(algo_dir, args.chunk_size or 10000, start_ts)
+        elif args.tail_traces and args.chunk_size > 0 and not args.all_services:
+            tail = TailHarvester(jaeger_fetcher, start_ts, algo_dir, args.chunk_size, args.tail_interval)
+            tail.start()
+
         sleep_with_progress_bar(args.run_seconds, "策略运行中")
 
         end_ts = utc_microtime()
         print(f"🕒 结束时间: {end_ts}")
+        if tail:
+            tail.stop(end_ts)
+        if receiver:
+            receiver.end_run(end_ts)
 
         # 6. 停止采集器
         if collector:
@@ -68,11 +92,21 @@ def run_algo(algo, experiment_dir):
             print("❌ Pod 清理失败，请检查！")
             return
 
-        # 9. 拉取 Jaeger trace 数据并保存
-        jaeger_fetcher = JaegerDataFetcher(f"{APP_SERVICE_NAME_MAP[args.app]}.{args.namespace}")
+        # 9. 拉取 Jaeger trace 数据并保存（使用 OTLP 接收器时 traces 已在运行期间写入）
         start_ts, end_ts = read_timestamps(os.path.join(algo_dir, "timestamps.txt"))
-        trace_data = jaeger_fetcher.fetch_all_traces(start_ts, end_ts)
-        jaeger_fetcher.save_traces(trace_data, algo_dir)
+        if receiver:
+            print(f"📥 traces 已由 OTLP 接收器写入 {algo_dir}")
+        elif tail:
+            tail.join()
+            if tail.error:
+                print("⚠️ 实时拉取失败，重新完整拉取一次")
+                jaeger_fetcher.verbose = True
+                jaeger_fetcher.stream_traces(start_ts, end_ts, algo_dir, args.chunk_size, resume=False)
+        elif args.chunk_size > 0:
+            jaeger_fetcher.stream_traces(start_ts, end_ts, algo_dir, args.chunk_size)
+        else:
+            trace_data = jaeger_fetcher.fetch_all_traces(start_ts, end_ts)
+            jaeger_fetcher.save_traces(trace_data, algo_dir)
 
     except Exception as e:
         print(f"❌ 主程序出错：{e}")
@@ -80,16 +114,30 @@ def run_algo(algo, experiment_dir):
         if collector and collector.is_alive():
             collector.stop()
             collector.join()
+        if tail and tail.is_alive():
+            tail.stop(utc_microtime())
+            tail.join()
+        if receiver and receiver.writer:
+            receiver.end_run(wait=False)
 
 def draw(experiment_dir):
     draw_metrics.main(experiment_dir)
     draw_duration.main(experiment_dir)
+    trace_analysis.main(experiment_dir)
 
 def runner(experiment_dir, selected_algos):
     generate_destination_rules.main(selected_algos, args.namespace, args.app)
 
-    for algo in selected_algos:
-        run_algo(algo, experiment_dir)
+    receiver = None
+    if args.otlp_port:
+        receiver = OtlpReceiver(port=args.otlp_port).start()
+
+    try:
+        for algo in selected_algos:
+            run_algo(algo, experiment_dir, receiver)
+    finally:
+        if receiver:
+            receiver.stop()
 
     draw(experiment_dir)
 
@@ -0,0 +1,378 @@
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from otlp import TracesData
+
+# 合成 trace 时使用的下游服务（对应 onlineBoutique）
+DOWNSTREAM_SERVICES = [
+    "productcatalogservice",
+    "currencyservice",
+    "cartservice",
+    "recommendationservice",
+    "adservice",
+    "shippingservice",
+]
+
+DURATION_UNITS = {"ns": 0.001, "us": 1, "µs": 1, "ms": 1000, "s": 1_000_000, "m": 60_000_000, "h": 3_600_000_000}
+
+def parse_duration(value):
+    """
+    把 Go 风格的时长字符串（如 "1.5ms"、"200us"）转换成微秒
+    """
+    return sum(float(num) * DURATION_UNITS[unit] for num, unit in re.findall(r"([\d.]+)(ns|us|µs|ms|s|m|h)", value))
+
+def _hex_id(rng, n):
+    return "".join(rng.choice("0123456789abcdef") for _ in range(n))
+
+def _make_span(rng, trace_id, span_id, parent_id, service, replica, start, duration):
+    pod = f"{service}-6659c9d65f-{replica:05d}"
+    tags = [
+        {"key": "node_id", "type": "string",
+         "value": f"sidecar~10.244.{rng.randint(0, 255)}.{rng.randint(0, 255)}~{pod}.default~default.svc.cluster.local"},
+        {"key": "zone", "type": "string", "value": ""},
+        {"key": "guid:x-request-id", "type": "string", "value": _hex_id(rng, 32)},
+        {"key": "http.url", "type": "string", "value": f"http://{service}/product/{_hex_id(rng, 10)}"},
+        {"key": "http.method", "type": "string", "value": "GET"},
+        {"key": "downstream_cluster", "type": "string", "value": "-"},
+        {"key": "http.protocol", "type": "string", "value": "HTTP/1.1"},
+        {"key": "request_size", "type": "string", "value": "0"},
+        {"key": "response_size", "type": "string", "value": str(rng.randint(100, 9000))},
+        {"key": "component", "type": "string", "value": "proxy"},
+        {"key": "upstream_cluster", "type": "string", "value": "inbound|8080||"},
+        {"key": "http.status_code", "type": "string", "value": "200"},
+        {"key": "response_flags", "type": "string", "value": "-"},
+        {"key": "istio.canonical_service", "type": "string", "value": service},
+        {"key": "span.kind", "type": "string", "value": "server"},
+    ]
+    return {
+        "traceID": trace_id,
+        "spanID": span_id,
+        "operationName": f"{service}.default.svc.cluster.local:80/*",
+        "references": [{"refType": "CHILD_OF", "traceID": trace_id, "spanID": parent_id}] if parent_id else [],
+        "startTime": start,
+        "duration": duration,
+        "tags": tags,
+        "logs": [],
+        "processID": None,
+        "warnings": None,
+    }
+
+def make_trace(rng, start_time, replicas=3, background=False):
+    """
+    生成一条 onlineBoutique 形状的 Jaeger trace（与 /api/traces/{id} 返回的 data[0] 结构一致）
+    :param rng: random.Random 实例
+    :param start_time: 根 span 的起始时间（微秒）
+    :param replicas: 每个服务的副本数
+    :param background: 生成不经过 frontend 的后台调用（某个下游服务调用另一个下游服务）
+    """
+    trace_id = _hex_id(rng, 32)
+    processes = {}
+    spans = []
+
+    def add_span(service, parent_id, start, duration):
+        pid = next((p for p, info in processes.items() if info["serviceName"] == f"{service}.default"), None)
+        if pid is None:
+            pid = f"p{len(processes) + 1}"
+            processes[pid] = {"serviceName": f"{service}.default", "tags": []}
+        span = _make_span(rng, trace_id, _hex_id(rng, 16), parent_id, service,
+                          rng.randrange(replicas), start, duration)
+        span["processID"] = pid
+        spans.append(span)
+        return span
+
+    if background:
+        caller, callee = rng.sample(DOWNSTREAM_SERVICES, 2)
+        total = rng.randint(2_000, 50_000)
+        root = add_span(caller, None, start_time, total)
+        client = add_span(caller, root["spanID"], start_time + 200, total - 400)
+        add_span(callee, client["spanID"], start_time + 400, total - 800)
+        return {"traceID": trace_id, "spans": spans, "processes": processes, "warnings": None}
+
+    total = rng.randint(20_000, 250_000)
+    root = add_span("loadgenerator", None, start_time, total)
+    frontend = add_span("frontend", root["spanID"], start_time + rng.randint(100, 3000), total - 4000)
+
+    cursor = frontend["startTime"] + 500
+    for service in rng.sample(DOWNSTREAM_SERVICES, rng.randint(1, len(DOWNSTREAM_SERVICES))):
+        duration = rng.randint(500, max(600, (total - 6000) // 4))
+        client = add_span("frontend", frontend["spanID"], cursor, duration)
+        add_span(service, client["spanID"], cursor + 200, max(1, duration - 400))
+        cursor += rng.randint(0, duration)
+
+    return {"traceID": trace_id, "spans": spans, "processes": processes, "warnings": None}
+
+def _group_by_service(trace):
+    groups = {}
+    for span in trace["spans"]:
+        groups.setdefault(trace["processes"][span["processID"]]["serviceName"], []).append(span)
+    return groups.items()
+
+def to_otlp_json(traces):
+    """
+    把 Jaeger 格式的 traces 转换成 OTLP JSON（TracesData），每个 trace 的每个服务对应一个 ResourceSpans
+    """
+    resource_spans = []
+    for trace in traces:
+        for service, spans in _group_by_service(trace):
+            resource_spans.append({
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                "scopeSpans": [{"scope": {"name": "envoy"}, "spans": [{
+                    "traceId": span["traceID"],
+                    "spanId": span["spanID"],
+                    "parentSpanId": span["references"][0]["spanID"] if span["references"] else "",
+                    "name": span["operationName"],
+                    "kind": 2,
+                    "startTimeUnixNano": str(span["startTime"] * 1000),
+                    "endTimeUnixNano": str((span["startTime"] + span["duration"]) * 1000),
+                    "attributes": [{"key": tag["key"], "value": {"stringValue": str(tag["value"])}}
+                                   for tag in span["tags"]],
+                } for span in spans]}],
+            })
+    return {"resourceSpans": resource_spans}
+
+def to_otlp_proto(traces):
+    """
+    把 Jaeger 格式的 traces 转换成 OTLP protobuf（TracesData），需要 opentelemetry-proto
+    """
+    traces_data = TracesData()
+    for trace in traces:
+        for service, spans in _group_by_service(trace):
+            resource_spans = traces_data.resource_spans.add()
+            attr = resource_spans.resource.attributes.add()
+            attr.key = "service.name"
+            attr.value.string_value = service
+            scope_spans = resource_spans.scope_spans.add()
+            scope_spans.scope.name = "envoy"
+            for span in spans:
+                otlp_span = scope_spans.spans.add()
+                otlp_span.trace_id = bytes.fromhex(span["traceID"])
+                otlp_span.span_id = bytes.fromhex(span["spanID"])
+                if span["references"]:
+                    otlp_span.parent_span_id = bytes.fromhex(span["references"][0]["spanID"])
+                otlp_span.name = span["operationName"]
+                otlp_span.kind = 2
+                otlp_span.start_time_unix_nano = span["startTime"] * 1000
+                otlp_span.end_time_unix_nano = (span["startTime"] + span["duration"]) * 1000
+                for tag in span["tags"]:
+                    attr = otlp_span.attributes.add()
+                    attr.key = tag["key"]
+                    attr.value.string_value = str(tag["value"])
+    return traces_data.SerializeToString()
+
+def _parse_rfc3339(value):
+    dt = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
+    return int(dt.timestamp()) * 1_000_000 + dt.microsecond
+
+class MockJaeger:
+    """
+    本地模拟的 Jaeger Query 服务，只实现 fetcher 用到的接口：
+      GET /jaeger/api/traces?service=...&start=...&end=...&limit=...[&minDuration&maxDuration&operation&tags]
+      GET /jaeger/api/traces/{traceID}
+      GET /jaeger/api/v3/traces?query.service_name=...&query.start_time_min=...（OTLP protobuf 或 JSON）
+      GET /jaeger/api/v3/traces/{traceID}
+      GET /api/v1/query（Prometheus，返回窗口内的 trace 数，供 count_traces 使用）
+    """
+
+    def __init__(self, start_time, end_time, num_traces, seed=0, delay_ms=0.0, port=0, truncate_ratio=0.0,
+                 background_ratio=0.0, max_page=None):
+        """
+        :param truncate_ratio: 搜索结果中被截断（缺少一个其他服务的 span）的 trace 比例，用来模拟 Jaeger 返回的不完整 trace
+        :param background_ratio: 不经过 frontend 的后台调用 trace 的比例
+        :param max_page: 服务端每页最多返回的 trace 数，请求的 limit 更大时按它截断（模拟服务端配置的上限或忽略分页参数的网关）
+        """
+        rng = random.Random(seed)
+        starts = sorted(rng.randint(start_time, end_time) for _ in range(num_traces))
+        self.traces = [make_trace(rng, s, background=rng.random() < background_ratio) for s in starts]
+        self.trace_map = {t["traceID"]: t for t in self.traces}
+        self.truncated_ids = {t["traceID"] for t in self.traces if rng.random() < truncate_ratio}
+        self.delay = delay_ms / 1000
+        self.max_page = max_page
+        self.request_count = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/jaeger/api/traces"
+
+    def search(self, service, start, end, limit, min_duration=None, max_duration=None, operation=None, tags=None):
+        # 与 Jaeger 相同，按属于 service 的 span 过滤：开始时间、时长、operation、tag 条件要求同一个 span 全部满足，
+        # 根 span（loadgenerator）早于窗口起点、frontend span 落在窗口内的 trace 也会返回。按根 span 时间返回最新的 limit 条
+        def span_matches(trace, span):
+            if trace["processes"][span["processID"]]["serviceName"] != service:
+                return False
+            if not start <= span["startTime"] <= end:
+                return False
+            if min_duration is not None and span["duration"] < min_duration:
+                return False
+            if max_duration is not None and span["duration"] > max_duration:
+                return False
+            if operation and span["operationName"] != operation:
+                return False
+            if tags:
+                span_tags = {tag["key"]: str(tag["value"]) for tag in span["tags"]}
+                return all(span_tags.get(k) == str(v) for k, v in tags.items())
+            return True
+
+        matched = [
+            t for t in self.traces
+            if any(span_matches(t, span) for span in t["spans"])
+        ]
+        return [self._search_view(t, service) for t in matched[::-1][:limit]]
+
+    def page_limit(self, requested):
+        # HTTP 接口实际使用的每页上限
+        return min(requested, self.max_page) if self.max_page else requested
+
+    def count(self, start, end):
+        return sum(1 for t in self.traces if start <= t["spans"][0]["startTime"] <= end)
+
+    def _search_view(self, trace, service):
+        if trace["traceID"] not in self.truncated_ids:
+            return trace
+        # 去掉第一个不属于被查询服务的非根 span（产生孤儿 span 或空进程），不同服务查到的缺口不同，合起来是完整的
+        spans = trace["spans"]
+        for i in range(1, len(spans)):
+            if trace["processes"][spans[i]["processID"]]["serviceName"] != service:
+                return dict(trace, spans=spans[:i] + spans[i + 1:])
+        return trace
+
+    def _record(self, size):
+        with self._lock:
+            self.request_count += 1
+            self.bytes_sent += size
+
+    def _make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                mock._record(len(body))
+
+            def _send_otlp(self, traces):
+                if TracesData is not None and "protobuf" in self.headers.get("Accept", ""):
+                    body, content_type = to_otlp_proto(traces), "application/x-protobuf"
+                else:
+                    body, content_type = json.dumps({"result": to_otlp_json(traces)}).encode(), "application/json"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                mock._record(len(body))
+
+            def _handle_v3(self, path, query):
+                trace_id = path.strip("/")
+                if trace_id:
+                    trace = mock.trace_map.get(trace_id)
+                    if trace is None:
+                        self._send_json(404, {"error": {"httpCode": 404, "message": "trace not found"}})
+                    else:
+                        self._send_otlp([trace])
+                    return
+
+                attributes = {
+                    key[len("query.attributes["):-1]: value
+                    for key, value in query.items() if key.startswith("query.attributes[")
+                }
+                self._send_otlp(mock.search(
+                    query.get("query.service_name"),
+                    _parse_rfc3339(query["query.start_time_min"]),
+                    _parse_rfc3339(query["query.start_time_max"]),
+                    # 新版网关读 query.num_traces，旧版读 query.search_depth
+                    mock.page_limit(int(query.get("query.num_traces", query.get("query.search_depth", 20)))),
+                    min_duration=parse_duration(query["query.duration_min"]) if "query.duration_min" in query else None,
+                    max_duration=parse_duration(query["query.duration_max"]) if "query.duration_max" in query else None,
+                    operation=query.get("query.operation_name"),
+                    tags=attributes or None,
+                ))
+
+            def do_GET(self):
+                if mock.delay:
+                    time.sleep(mock.delay)
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+                if url.path == "/api/v1/query":
+                    end = int(float(query["time"]) * 1_000_000)
+                    seconds = int(re.search(r"\[(\d+)s\]", query["query"]).group(1))
+                    value = mock.count(end - seconds * 1_000_000, end)
+                    self._send_json(200, {"status": "success", "data": {
+                        "resultType": "vector", "result": [{"metric": {}, "value": [end / 1_000_000, str(value)]}]}})
+                    return
+
+                v3_prefix = "/jaeger/api/v3/traces"
+                if url.path.startswith(v3_prefix):
+                    self._handle_v3(url.path[len(v3_prefix):], query)
+                    return
+
+                prefix = "/jaeger/api/traces"
+                if not url.path.startswith(prefix):
+                    self._send_json(404, {"data": None, "errors": [{"code": 404, "msg": "not found"}]})
+                    return
+
+                trace_id = url.path[len(prefix):].strip("/")
+                if trace_id:
+                    trace = mock.trace_map.get(trace_id)
+                    if trace is None:
+                        self._send_json(404, {"data": None, "errors": [{"code": 404, "msg": "trace not found"}]})
+                    else:
+                        self._send_json(200, {"data": [trace], "total": 0, "limit": 0, "offset": 0, "errors": None})
+                    return
+
+                data = mock.search(
+                    query.get("service"),
+                    int(query.get("start", 0)),
+                    int(query.get("end", 2 ** 63)),
+                    mock.page_limit(int(query.get("limit", 20))),
+                    min_duration=parse_duration(query["minDuration"]) if "minDuration" in query else None,
+                    max_duration=parse_duration(query["maxDuration"]) if "maxDuration" in query else None,
+                    operation=query.get("operation"),
+                    tags=json.loads(query["tags"]) if "tags" in query else None,
+                )
+                self._send_json(200, {"data": data, "total": 0, "limit": 0, "offset": 0, "errors": None})
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟 Jaeger Query 服务")
+    parser.add_argument("--port", type=int, default=16686)
+    parser.add_argument("--traces", type=int, default=5000, help="合成 trace 数量")
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="每个请求的模拟网络延迟（毫秒）")
+    args = parser.parse_args()
+
+    end_ts = int(time.time() * 1_000_000)
+    mock = MockJaeger(end_ts - 300_000_000, end_ts, args.traces, delay_ms=args.delay_ms, port=args.port)
+    print(f"🧪 Mock Jaeger 已启动: {mock.base_url}（{args.traces} 条 traces）")
+    mock.server.serve_forever()
@@ -0,0 +1,134 @@
+import base64
+import json
+import string
+
+try:
+    from opentelemetry.proto.trace.v1.trace_pb2 import TracesData
+except ImportError:  # 可选依赖：pip install opentelemetry-proto
+    TracesData = None
+
+# Istio/Envoy 在 span 上记录 sidecar 信息的属性，pod 名从这里解析
+POD_ATTRIBUTE = "node_id"
+SERVICE_ATTRIBUTE = "service.name"
+
+_HEX_DIGITS = set(string.hexdigits)
+
+def _decode_id(value):
+    # OTLP JSON 规范里 ID 是十六进制字符串，但 grpc-gateway 会把 bytes 编码成 base64，两种都兼容
+    if not value:
+        return None
+    if len(value) in (16, 32) and set(value) <= _HEX_DIGITS:
+        return value.lower()
+    return base64.b64decode(value).hex() or None
+
+def iter_spans_from_proto(traces_data):
+    """
+    遍历 protobuf TracesData / ExportTraceServiceRequest 中的 span，只取 Trace 模型用到的字段
+    :return: (trace_id, span_id, parent_id, service, operation, start_us, duration_us, node_id) 迭代器
+    """
+    for resource_spans in traces_data.resource_spans:
+        service = "unknown"
+        for attr in resource_spans.resource.attributes:
+            if attr.key == SERVICE_ATTRIBUTE:
+                service = attr.value.string_value
+                break
+        for scope_spans in resource_spans.scope_spans:
+            for span in scope_spans.spans:
+                node_id = None
+                for attr in span.attributes:
+                    if attr.key == POD_ATTRIBUTE:
+                        node_id = attr.value.string_value
+                        break
+                start_ns = span.start_time_unix_nano
+                yield (span.trace_id.hex(), span.span_id.hex(), span.parent_span_id.hex() or None, service,
+                       span.name, start_ns // 1000, (span.end_time_unix_nano - start_ns) // 1000, node_id)
+
+def iter_spans_from_json(payload):
+    """
+    遍历 OTLP JSON 中的 span，支持 {"resourceSpans": [...]} 和 api_v3 的 {"result": {"resourceSpans": [...]}}
+    :return: 同 iter_spans_from_proto
+    """
+    payload = payload.get("result", payload)
+    for resource_spans in payload.get("resourceSpans") or []:
+        service = "unknown"
+        for attr in resource_spans.get("resource", {}).get("attributes") or []:
+            if attr["key"] == SERVICE_ATTRIBUTE:
+                service = attr["value"].get("stringValue", "unknown")
+                break
+        for scope_spans in resource_spans.get("scopeSpans") or []:
+            for span in scope_spans.get("spans") or []:
+                node_id = None
+                for attr in span.get("attributes") or []:
+                    if attr["key"] == POD_ATTRIBUTE:
+                        node_id = attr["value"].get("stringValue")
+                        break
+                start_ns = int(span["startTimeUnixNano"])
+                yield (_decode_id(span["traceId"]), _decode_id(span["spanId"]), _decode_id(span.get("parentSpanId")),
+                       service, span.get("name", ""), start_ns // 1000,
+                       (int(span["endTimeUnixNano"]) - start_ns) // 1000, node_id)
+
+def _iter_json_documents(text):
+    # api_v3 的 HTTP 网关以流的形式返回，可能是多个首尾相接的 JSON 对象
+    decoder = json.JSONDecoder()
+    index = 0
+    while True:
+        while index < len(text) and text[index].isspace():
+            index += 1
+        if index >= len(text):
+            return
+        document, index = decoder.raw_decode(text, index)
+        yield document
+
+def iter_spans(content):
+    """
+    解析 OTLP 负载（protobuf 或 JSON 字节串），返回 span 元组迭代器
+    """
+    if content.lstrip()[:1] in (b"{", b"["):
+        for document in _iter_json_documents(content.decode()):
+            yield from iter_spans_from_json(document)
+        return
+
+    if TracesData is None:
+        raise ImportError("解析 OTLP protobuf 需要安装 opentelemetry-proto")
+    yield from iter_spans_from_proto(TracesData.FromString(content))
+
+def add_span(trace_map, span):
+    """
+    把一个 span 元组加入 trace_map（traceID -> Jaeger 格式的 trace dict），结构与 /api/traces/{id} 的 data[0] 一致，
+    因此可以直接用 Trace({"data": [trace]}) 构造
+    """
+    trace_id, span_id, parent_id, service, operation, start_us, duration_us, node_id = span
+    trace = trace_map.get(trace_id)
+    if trace is None:
+        trace = trace_map[trace_id] = {"traceID": trace_id, "spans": [], "processes": {}, "_pids": {}}
+
+    pid = trace["_pids"].get(service)
+    if pid is None:
+        pid = trace["_pids"][service] = f"p{len(trace['_pids']) + 1}"
+        trace["processes"][pid] = {"serviceName": service, "tags": []}
+
+    trace["spans"].append({
+        "traceID": trace_id,
+        "spanID": span_id,
+        "operationName": operation,
+        "references": [{"refType": "CHILD_OF", "traceID": trace_id, "spanID": parent_id}] if parent_id else [],
+        "startTime": start_us,
+        "duration": duration_us,
+        "tags": [{"key": POD_ATTRIBUTE, "type": "string", "value": node_id}] if node_id else [],
+        "processID": pid,
+    })
+
+def finish_trace(trace):
+    trace.pop("_pids", None)
+    # 和 Jaeger 一样按开始时间排序，保证 spans[0] 是最早的 span
+    trace["spans"].sort(key=lambda s: s["startTime"])
+    return trace
+
+def parse_traces(content):
+    """
+    把 OTLP 负载转换成 Jaeger 格式的 trace dict 列表
+    """
+    trace_map = {}
+    for span in iter_spans(content):
+        add_span(trace_map, span)
+    return [finish_trace(trace) for trace in trace_map.values()]
@@ -0,0 +1,200 @@
+import gzip
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from otlp import iter_spans, add_span, finish_trace
+from trace_model import Trace
+from trace_store import TraceChunkWriter
+
+class OtlpReceiver:
+    """
+    进程内的 OTLP/HTTP span 接收器（POST /v1/traces，支持 protobuf 和 JSON，支持 gzip）。
+    把网格的 tracing exporter 指向它（例如 Istio 的 opentelemetry extensionProvider 指向 <本机>:4318），
+    span 会按 traceID 实时拼装成 Trace，某条 trace 超过 completion_timeout 秒没有新 span 即视为完成，
+    直接写入当前策略目录的 trace_chunks，不再需要从 Jaeger 查询，也不受 Jaeger 存储上限影响。
+    已经写出的 trace 之后才到达的 span 不会另起一条同 ID 的 trace，而是丢弃并计入 stats["late_spans"]；
+    completion_timeout 要大于各 exporter 的发送间隔（Envoy / OTel SDK 默认约 5 秒），否则同一条 trace 会被拆开等待。
+    """
+
+    def __init__(self, host="0.0.0.0", port=4318, completion_timeout=15.0):
+        self.completion_timeout = completion_timeout
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.stats = {"requests": 0, "spans": 0, "traces": 0, "dropped_spans": 0, "late_spans": 0}
+        self.writer = None
+        self._window = (0, float("inf"))
+        self._open_traces = {}
+        self._last_seen = {}
+        # 本轮已经写出的 traceID
+        self._reaped = set()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop_flag = threading.Event()
+        self._threads = []
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self.server.serve_forever, daemon=True),
+            threading.Thread(target=self._reap_loop, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        print(f"🟢 OTLP 接收器已启动: http://0.0.0.0:{self.port}/v1/traces")
+        return self
+
+    def stop(self):
+        self._stop_flag.set()
+        self.server.shutdown()
+        self.server.server_close()
+        if self.writer:
+            self.end_run(wait=False)
+
+    def start_run(self, output_dir, chunk_size=10000, start_time=None):
+        """
+        开始接收一个策略的 traces，写入 output_dir/trace_chunks
+        :param start_time: 运行窗口起始时间戳（微秒），更早开始的 trace 只收到了一部分 spans，会被丢弃
+        """
+        with self._lock:
+            self._open_traces.clear()
+            self._last_seen.clear()
+            self._reaped.clear()
+            self._window = (start_time or 0, float("inf"))
+            self.writer = TraceChunkWriter(output_dir, chunk_size)
+
+    def end_run(self, end_time=None, wait=True):
+        """
+        结束当前策略：等待 completion_timeout 让最后的 spans 到达，然后把所有未完成的 trace 写出
+        :param end_time: 运行窗口结束时间戳（微秒），之后才开始的 trace 会被丢弃
+        :return: 本轮写入的 trace 数
+        """
+        if wait:
+            time.sleep(self.completion_timeout)
+        with self._lock:
+            if end_time is not None:
+                self._window = (self._window[0], end_time)
+            writer, self.writer = self.writer, None
+            window = self._window
+            traces = list(self._open_traces.values())
+            self._open_traces.clear()
+            self._last_seen.clear()
+            self._reaped.clear()
+        if writer is None:
+            return 0
+        # 回收线程已经取出的 trace 会在它释放 _write_lock 前写完，之后才关闭
+        with self._write_lock:
+            writer.extend(self._build(traces, window))
+            writer.close()
+        return writer.total
+
+    def ingest(self, content):
+        """
+        处理一次 OTLP 导出请求的内容（protobuf 或 JSON 字节串）
+        """
+        now = time.monotonic()
+        spans = list(iter_spans(content))
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.writer is None:
+                self.stats["dropped_spans"] += len(spans)
+                return
+            for span in spans:
+                if span[0] in self._reaped:
+                    self.stats["late_spans"] += 1
+                    continue
+                self.stats["spans"] += 1
+                add_span(self._open_traces, span)
+                self._last_seen[span[0]] = now
+
+    def _build(self, trace_dicts, window):
+        # window 在取出 trace 时一并读取：下一个策略 start_run 之后，上一轮的 trace 仍按上一轮的窗口过滤
+        window_start, window_end = window
+        traces = [Trace({"data": [finish_trace(trace)]}, lazy=True).pack() for trace in trace_dicts]
+        traces = [trace for trace in traces if window_start <= trace.start_time <= window_end]
+        with self._lock:
+            self.stats["traces"] += len(traces)
+        return traces
+
+    def _reap_loop(self):
+        # 定期把超过 completion_timeout 没有新 span 的 trace 写出
+        # 先拿 _write_lock 再取出 trace：end_run 要等这一批写完才能关闭 writer，不会写进已关闭的 writer
+        while not self._stop_flag.wait(1.0):
+            deadline = time.monotonic() - self.completion_timeout
+            with self._write_lock:
+                with self._lock:
+                    writer, window = self.writer, self._window
+                    if writer is None:
+                        continue
+                    expired = [trace_id for trace_id, seen in self._last_seen.items() if seen < deadline]
+                    traces = [self._open_traces.pop(trace_id) for trace_id in expired]
+                    for trace_id in expired:
+                        del self._last_seen[trace_id]
+                    self._reaped.update(expired)
+                if traces:
+                    writer.extend(self._build(traces, window))
+
+    def _make_handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                content = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.rstrip("/") != "/v1/traces":
+                    self._reply(404, b"not found", "text/plain")
+                    return
+                if self.headers.get("Content-Encoding") == "gzip":
+                    content = gzip.decompress(content)
+
+                try:
+                    receiver.ingest(content)
+                except Exception as e:
+                    print(f"❌ OTLP 请求解析失败: {e}")
+                    self._reply(400, str(e).encode(), "text/plain")
+                    return
+
+                # ExportTraceServiceResponse 为空消息
+                if "json" in self.headers.get("Content-Type", ""):
+                    self._reply(200, b"{}", "application/json")
+                else:
+                    self._reply(200, b"", "application/x-protobuf")
+
+        return Handler
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="OTLP/HTTP span 接收器")
+    parser.add_argument("output_dir", help="traces 保存目录")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--completion-timeout", type=float, default=15.0,
+                        help="trace 多少秒没有新 span 视为完成，要大于 exporter 的发送间隔")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    receiver = OtlpReceiver(port=args.port, completion_timeout=args.completion_timeout).start()
+    receiver.start_run(args.output_dir, args.chunk_size)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n🛑 收到 Ctrl+C，停止接收")
+    receiver.end_run()
+    receiver.stop()
+    print(f"📊 {receiver.stats}")
@@ -0,0 +1,134 @@
+import argparse
+import gzip
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from jaeger_decode import decode_trace_list, decode_traces
+from trace_model import SpanTable, Trace
+from trace_store import TraceChunks, has_chunks, load_chunk
+
+# 按文件分片时能识别的数据文件，优先级从高到低
+TRACE_FILES = ("trace_data.pkl.gz", "trace_results.pkl", "trace_results.json")
+BATCH_DIR = "batches"
+
+def _read_bytes(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return f.read()
+
+def _load_traces(path):
+    if path.endswith(".json") or path.endswith(".json.gz"):
+        return decode_trace_list(_read_bytes(path))
+    # pkl.gz 中可能是 Trace 对象（拉取器保存的），也可能是原始的 {"data": [trace]}（temp.py 切出的批次）
+    return [item if isinstance(item, Trace) else Trace(item) for item in load_chunk(path)]
+
+def _table_from_file(path):
+    return SpanTable.from_traces(_load_traces(path))
+
+def _table_from_payloads(payloads):
+    return SpanTable.from_traces(trace for payload in payloads for trace in decode_traces(payload))
+
+def _imap(func, items, workers):
+    # 按输入顺序逐个产出结果，同时在跑的分片不超过 2 * workers 个，结果不会在主进程中堆积。
+    # workers=1 时在当前进程中执行，方便调试，也省去进程启动的开销
+    if workers == 1 or len(items) <= 1:
+        yield from map(func, items)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _map(func, items, workers):
+    return list(_imap(func, items, workers))
+
+def iter_tables(paths, workers=None):
+    """
+    与 load_table 相同，但按文件顺序逐个产出各文件的 SpanTable，适合边加载边写出的场景
+    """
+    return _imap(_table_from_file, list(paths), workers or os.cpu_count())
+
+def load_table(paths, workers=None):
+    """
+    多进程加载一组 trace 文件，每个文件是一个分片：子进程负责解码并构造 Trace，
+    只把列式的 SpanTable（几组 NumPy 数组和字典）传回主进程，最后按文件顺序拼接。
+    主进程不反序列化任何 Trace 对象，加载时间随核数近似线性下降
+    :param paths: 文件路径列表，支持 chunk / 批次 pkl.gz 和 [{"data": [trace]}, ...] 形式的 JSON（可 gzip）
+    :param workers: 进程数，默认为 CPU 核数
+    """
+    paths = list(paths)
+    return SpanTable.concat(_map(_table_from_file, paths, workers or os.cpu_count()))
+
+def load_payloads(payloads, workers=None, batch_size=64):
+    """
+    多进程解码一组 Jaeger 查询响应（{"data": [trace, ...]} 的 bytes），每 batch_size 个响应一个分片
+    """
+    payloads = list(payloads)
+    shards = [payloads[i:i + batch_size] for i in range(0, len(payloads), batch_size)]
+    return SpanTable.concat(_map(_table_from_payloads, shards, workers or os.cpu_count()))
+
+def source_files(algo_dir):
+    """
+    算法目录下可以分片并行加载的文件：trace_chunks 中的各个 chunk、batches 中的批次，或者单个数据文件
+    """
+    if has_chunks(algo_dir):
+        return TraceChunks(algo_dir).chunk_paths()
+
+    batch_dir = os.path.join(algo_dir, BATCH_DIR)
+    if os.path.isdir(batch_dir):
+        batches = [name for name in os.listdir(batch_dir) if name.endswith(".pkl.gz")]
+        # data_batch_10 排在 data_batch_9 之后
+        batches.sort(key=lambda name: (len(name), name))
+        if batches:
+            return [os.path.join(batch_dir, name) for name in batches]
+
+    for name in TRACE_FILES:
+        path = os.path.join(algo_dir, name)
+        if os.path.isfile(path):
+            return [path]
+    return []
+
+def load_table_from_dir(algo_dir, workers=None):
+    return load_table(source_files(algo_dir), workers)
+
+def load_all_tables_from_experiment(experiment_dir, workers=None, skip=()):
+    """
+    与 draw_duration.load_all_traces_from_experiment 相同的目录约定，返回 {算法: SpanTable}。
+    所有算法的文件放进同一个进程池，算法之间也是并行的
+    :param skip: 不需要加载的算法（例如已经从 span_store 读到的）
+    """
+    algo_paths = {}
+    for algo in sorted(os.listdir(experiment_dir)):
+        algo_dir = os.path.join(experiment_dir, algo)
+        if algo not in skip and os.path.isdir(algo_dir):
+            paths = source_files(algo_dir)
+            if paths:
+                algo_paths[algo] = paths
+
+    all_paths = [path for paths in algo_paths.values() for path in paths]
+    tables = iter(_map(_table_from_file, all_paths, workers or os.cpu_count()))
+    return {algo: SpanTable.concat([next(tables) for _ in paths]) for algo, paths in algo_paths.items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多进程加载 trace 数据并转换为 SpanTable")
+    parser.add_argument("path", help="算法目录，或者一个实验目录（配合 --experiment）")
+    parser.add_argument("--experiment", action="store_true", help="path 是实验目录，加载其下所有算法")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为 CPU 核数")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.experiment:
+        tables = load_all_tables_from_experiment(args.path, args.workers)
+    else:
+        tables = {os.path.basename(os.path.normpath(args.path)): load_table_from_dir(args.path, args.workers)}
+    elapsed = time.perf_counter() - start
+
+    for algo, table in tables.items():
+        print(f"📊 {algo}: {table.num_traces} 条 traces，{len(table)} 个 span")
+    print(f"⏱️ 加载耗时 {elapsed:.2f}s（{args.workers or os.cpu_count()} 个进程）")
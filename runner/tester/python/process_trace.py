@@ -1,54 +1,151 @@
+import bisect
 import json
 import os
+import ijson
+from trace_store import TraceChunkWriter, TraceChunks, has_chunks
 from utils import read_timestamps
 
-def split_traces_by_time(trace_file, start_ts, end_ts, output_dir):
-    # 读取 trace 文件
+class WindowIndex:
+    """
+    按起始时间排序的时间窗口索引，查询某条 trace 落在哪些窗口中。
+    窗口 [start_ts, end_ts] 两端都包含；窗口之间可以重叠
+    """
+
+    def __init__(self, windows):
+        """
+        :param windows: (start_ts, end_ts, 任意附加值) 的列表
+        """
+        self.windows = sorted(windows, key=lambda w: (w[0], w[1]))
+        self.starts = [w[0] for w in self.windows]
+        # 前缀最大结束时间单调不减，可以二分出第一个可能包含给定时间的窗口
+        self.max_ends = []
+        for _, end_ts, _ in self.windows:
+            self.max_ends.append(max(end_ts, self.max_ends[-1]) if self.max_ends else end_ts)
+
+    def match(self, span_times):
+        """
+        :param span_times: 一条 trace 中所有 span 的开始时间（已排序）
+        :return: 至少有一个 span 开始时间落在其中的窗口
+        """
+        if not span_times:
+            return []
+        lo = bisect.bisect_left(self.max_ends, span_times[0])
+        hi = bisect.bisect_right(self.starts, span_times[-1])
+        matched = []
+        for window in self.windows[lo:hi]:
+            i = bisect.bisect_left(span_times, window[0])
+            if i < len(span_times) and span_times[i] <= window[1]:
+                matched.append(window)
+        return matched
+
+class _JsonArrayWriter:
+    # 逐条追加写出 JSON 数组，先写到临时文件，close 时再替换，第一条数据到来时才创建文件；
+    # 出错时 abort 删除临时文件，不会留下看起来完整的半截结果
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def write(self, encoded):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(f"{self.path}.tmp", "w")
+            self._file.write("[\n")
+        elif self.count:
+            self._file.write(",\n")
+        self._file.write(encoded)
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.write("\n]\n")
+            self._file.close()
+            os.replace(f"{self.path}.tmp", self.path)
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            os.remove(f"{self.path}.tmp")
+
+def split_traces_by_windows(trace_file, windows):
+    """
+    用 ijson 流式解析一遍 trace 文件，把每条 trace 写入所有包含它某个 span 开始时间的窗口目录。
+    只解析一次、只持有当前这一条 trace，耗时与窗口（算法）数量无关
+    :param trace_file: [{"data": [trace]}, ...] 格式的 trace_results.json
+    :param windows: (start_ts, end_ts, output_dir) 的列表，结果保存为 {output_dir}/trace_results.json
+    :return: {output_dir: trace 数}
+    """
+    index = WindowIndex(windows)
+    writers = {output_dir: _JsonArrayWriter(os.path.join(output_dir, "trace_results.json"))
+               for _, _, output_dir in windows}
+
     try:
-        with open(trace_file, 'r') as f:
-            trace_data = json.load(f)
+        with open(trace_file, "rb") as f:
+            for trace in ijson.items(f, "item", use_float=True):
+                span_times = sorted(int(span["startTime"]) for span in trace["data"][0]["spans"])
+                matched = index.match(span_times)
+                # 同一条 trace 落在多个窗口时只序列化一次
+                encoded = json.dumps(trace) if matched else None
+                for _, _, output_dir in matched:
+                    writers[output_dir].write(encoded)
     except FileNotFoundError:
         print(f"❌ 找不到文件 {trace_file}")
-        return
-
-    # 存储筛选后的 traces
-    filter_traces = []
-
-    # 遍历每个 trace 和其中的 spans，筛选符合时间范围的 spans
-    for trace in trace_data:  # 假设根数据是一个包含 'data' 键的列表
-        is_in_time_span = False
-        for span in trace['data'][0]['spans']:
-            span_start_time = int(span['startTime'])
-            # 筛选出在指定时间范围内的 spans
-            if start_ts <= span_start_time <= end_ts:
-                is_in_time_span = True
-                break
-        if (is_in_time_span):
-            filter_traces.append(trace)
-
-    # 如果没有找到符合条件的 spans，提前退出
-    if not filter_traces:
-        print(f"❌ 没有找到符合时间范围的 trace 数据")
-        return
-
-    # 将拆分后的数据保存到目标文件夹
-    output_file = os.path.join(output_dir, "trace_results.json")
-    with open(output_file, 'w') as f:
-        json.dump(filter_traces, f, indent=4)
-
-    print(f"📊 {len(filter_traces)} 条数据已保存到 {output_file}")
+        return {}
+    except BaseException:
+        # 文件被截断或损坏时 ijson 在中途报错，已写出的部分不能当作完整结果发布
+        for writer in writers.values():
+            writer.abort()
+        raise
+    for writer in writers.values():
+        writer.close()
+
+    for output_dir, writer in writers.items():
+        if writer.count:
+            print(f"📊 {writer.count} 条数据已保存到 {writer.path}")
+        else:
+            print(f"❌ 没有找到符合时间范围的 trace 数据: {output_dir}")
+    return {output_dir: writer.count for output_dir, writer in writers.items()}
+
+def split_traces_by_time(trace_file, start_ts, end_ts, output_dir):
+    """
+    只拆分一个时间窗口；需要拆分多个窗口时用 split_traces_by_windows，文件只解析一遍
+    """
+    return split_traces_by_windows(trace_file, [(start_ts, end_ts, output_dir)])
+
+def split_chunks_by_windows(source_dir, windows, chunk_size=10000):
+    """
+    按时间窗口拆分 trace_chunks 存储：每个窗口只读取开始时间范围与之重叠的 chunk（见 TraceChunks.query），
+    耗时与窗口大小成正比，与整个实验的数据量无关。
+    这里按 trace 的开始时间判断是否属于窗口，窗口两端都包含
+    :param source_dir: 包含 trace_chunks 的目录
+    :param windows: (start_ts, end_ts, output_dir) 的列表，结果写入 {output_dir}/trace_chunks
+    :return: {output_dir: trace 数}
+    """
+    chunks = TraceChunks(source_dir)
+    counts = {}
+    for start_ts, end_ts, output_dir in windows:
+        blocks = chunks.blocks(start_ts, end_ts + 1)
+        writer = TraceChunkWriter(output_dir, chunk_size)
+        writer.extend(chunks.query(start_ts, end_ts + 1))
+        writer.close()
+        print(f"📊 读取了 {len(blocks)}/{len(chunks.index['chunks'])} 个 chunk")
+        counts[output_dir] = writer.total
+    return counts
 
 def process_all_traces(app, experiment_id):
-    # 遍历所有策略和时间戳，调用处理函数
+    # 收集所有算法的时间窗口，一次完成全部拆分；实验目录下是 trace_chunks 时按时间索引只读取各窗口对应的 chunk
     base_dir = os.path.join("data", app, str(experiment_id))
-    algo_list = os.listdir(base_dir)
-    trace_file = base_dir.join("trace_results.json")
-    for algo in algo_list:
-        algo_dir = base_dir.join(algo)
-        if os.path.isdir(algo_dir):
-            timestamps_file = os.path.join(algo_dir, "timestamps.txt")
+    trace_file = os.path.join(base_dir, "trace_results.json")
+    windows = []
+    for algo in os.listdir(base_dir):
+        timestamps_file = os.path.join(base_dir, algo, "timestamps.txt")
+        if os.path.isfile(timestamps_file):
             start_ts, end_ts = read_timestamps(timestamps_file)
-            split_traces_by_time(trace_file, start_ts, end_ts, algo_dir)
+            windows.append((start_ts, end_ts, os.path.join(base_dir, algo)))
+    if has_chunks(base_dir):
+        split_chunks_by_windows(base_dir, windows)
+    else:
+        split_traces_by_windows(trace_file, windows)
 
 if __name__ == '__main__':
     process_all_traces("onlineBoutique", 1743993804744946)
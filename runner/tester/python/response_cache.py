@@ -0,0 +1,88 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+class ResponseCache:
+    """
+    Jaeger 查询结果的本地磁盘缓存。
+    以完整查询（URL + 参数）的 sha256 作为文件名，内容 gzip 压缩保存在 cache_dir 下；
+    总大小超过 max_bytes 时按最近访问时间（文件 mtime）淘汰最旧的条目。
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = sum(entry.stat().st_size for entry in self._entries())
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    @staticmethod
+    def make_key(url, params=None):
+        query = json.dumps([url, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(query.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json.gz")
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".json.gz")]
+
+    def get(self, url, params=None):
+        """
+        :return: 缓存的响应内容（bytes），未命中时返回 None
+        """
+        path = self._path(self.make_key(url, params))
+        try:
+            with gzip.open(path, "rb") as f:
+                content = f.read()
+            os.utime(path)  # 更新访问时间，供 LRU 淘汰使用
+        except (FileNotFoundError, EOFError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return content
+
+    def put(self, url, params, content):
+        path = self._path(self.make_key(url, params))
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=3) as f:
+            f.write(content)
+        size = os.path.getsize(tmp_path)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += size - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # 按 mtime 从旧到新删除，直到总大小降到上限的 90%
+        target = self.max_bytes * 0.9
+        for entry in sorted(self._entries(), key=lambda e: e.stat().st_mtime):
+            if self._total_bytes <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._total_bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes": self._total_bytes,
+                "entries": len(self._entries()),
+            }
@@ -0,0 +1,108 @@
+import gzip
+import json
+import os
+
+import numpy as np
+
+from trace_model import SpanTable
+
+SHAPE_INDEX = "shape_index.json.gz"
+
+class ShapeIndex:
+    """
+    结构指纹（Trace.shape）-> 该结构下所有 trace 的索引：traceID、开始时间、总耗时，以及涉及的服务。
+    按结构取延迟分布、跨算法比较同一结构时直接查表，不需要再遍历 traces；
+    只用到 trace 级别的字段，惰性 Trace 不会因此被展开
+    """
+
+    def __init__(self):
+        self.shapes = {}
+        self.total = 0
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def __contains__(self, shape):
+        return shape in self.shapes
+
+    def add(self, trace):
+        entry = self.shapes.get(trace.shape)
+        if entry is None:
+            entry = self.shapes[trace.shape] = {
+                "services": sorted(set(trace.service_map.values())),
+                "trace_ids": [], "start_times": [], "durations": [],
+            }
+        entry["trace_ids"].append(trace.trace_id)
+        entry["start_times"].append(trace.start_time)
+        entry["durations"].append(trace.total_duration)
+        self.total += 1
+
+    def extend(self, traces):
+        for trace in traces:
+            self.add(trace)
+        return self
+
+    def services(self, shape):
+        return self.shapes[shape]["services"]
+
+    def trace_ids(self, shape):
+        return self.shapes[shape]["trace_ids"]
+
+    def start_times(self, shape):
+        return np.asarray(self.shapes[shape]["start_times"], dtype=np.int64)
+
+    def durations(self, shape):
+        return np.asarray(self.shapes[shape]["durations"], dtype=np.int64)
+
+    def counts(self):
+        """
+        :return: {结构指纹: trace 数}，按数量从多到少排列
+        """
+        counts = {shape: len(entry["trace_ids"]) for shape, entry in self.shapes.items()}
+        return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt") as f:
+            json.dump({"total": self.total, "shapes": self.shapes}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt") as f:
+            data = json.load(f)
+        index = cls()
+        index.total = data["total"]
+        index.shapes = data["shapes"]
+        return index
+
+    @classmethod
+    def from_traces(cls, traces):
+        """
+        :param traces: Trace 可迭代对象或 SpanTable
+        """
+        if isinstance(traces, SpanTable):
+            return cls.from_table(traces)
+        return cls().extend(traces)
+
+    @classmethod
+    def from_table(cls, table):
+        index = cls()
+        shapes = table.trace_shapes
+        if shapes is None:
+            shapes = [trace.shape for trace in table.to_traces()]
+        start_times = table.trace_start_times().tolist()
+        durations = table.total_durations().tolist()
+        for i, shape in enumerate(shapes):
+            entry = index.shapes.get(shape)
+            if entry is None:
+                codes = np.unique(table.service_code[table.trace_offsets[i]:table.trace_offsets[i + 1]])
+                entry = index.shapes[shape] = {
+                    "services": sorted(table.services[code] for code in codes),
+                    "trace_ids": [], "start_times": [], "durations": [],
+                }
+            entry["trace_ids"].append(table.trace_ids[i])
+            entry["start_times"].append(start_times[i])
+            entry["durations"].append(durations[i])
+        index.total = len(shapes)
+        return index
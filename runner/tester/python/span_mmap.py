@@ -0,0 +1,330 @@
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+import parallel_loader
+from trace_model import SpanTable
+from trace_store import write_json_atomic
+
+MMAP_DIR = "span_mmap"
+META_FILE = "meta.json"
+BLOCK_ROWS = 1 << 22
+
+# 每列一个定长的二进制文件（{name}.bin），按行依次追加；字符串列（服务名、pod、operation、结构指纹）做字典编码，
+# 字典保存在 meta.json 中。span 级别的列长度为 span 数，trace 级别的列长度为 trace 数
+SPAN_COLUMNS = {
+    "trace_index": "<i4",
+    "span_id": "S16",
+    "parent_index": "<i8",
+    "has_parent": "?",
+    "start_time": "<i8",
+    "duration": "<i8",
+    "service_code": "<i4",
+    "pod_code": "<i4",
+    "operation_code": "<i4",
+}
+TRACE_COLUMNS = {
+    "trace_id": "S32",
+    "trace_offset": "<i8",
+    "trace_start": "<i8",
+    "trace_duration": "<i8",
+    "shape_code": "<i4",
+}
+LEVELS = {"service": "services", "pod": "pods", "operation": "operations"}
+
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+_NIBBLE_SHIFTS = np.arange(60, -4, -4, dtype=np.uint64)
+
+def mmap_dir(experiment_dir, algo):
+    return os.path.join(experiment_dir, MMAP_DIR, algo)
+
+def list_algos(experiment_dir):
+    root = os.path.join(experiment_dir, MMAP_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.isfile(os.path.join(root, name, META_FILE)))
+
+def _fixed_bytes(values, dtype):
+    width = np.dtype(dtype).itemsize
+    encoded = [value.encode() for value in values]
+    if any(len(value) > width for value in encoded):
+        raise ValueError(f"ID 超过 {width} 字节，无法按 {dtype} 定长保存")
+    return np.array(encoded, dtype=dtype)
+
+def _span_id_bytes(table):
+    if table.span_ids.dtype != np.uint64:
+        return _fixed_bytes(table.span_ids, SPAN_COLUMNS["span_id"])
+    # uint64 按 16 位十六进制整列转换，不逐个格式化
+    nibbles = (table.span_ids[:, None] >> _NIBBLE_SHIFTS) & np.uint64(0xF)
+    return _HEX_DIGITS[nibbles.astype(np.intp)].view(SPAN_COLUMNS["span_id"]).ravel()
+
+class SpanMmapWriter:
+    """
+    把一个算法的 SpanTable 逐批追加写入 {experiment_dir}/span_mmap/{algo}/，内存中只保留当前这一批。
+    各批次的字典编码合并成全局字典后重新映射；close 时写入 meta.json，没有 meta.json 的目录视为未写完
+    """
+
+    def __init__(self, experiment_dir, algo):
+        self.folder = mmap_dir(experiment_dir, algo)
+        if os.path.isdir(self.folder):
+            shutil.rmtree(self.folder)
+        os.makedirs(self.folder)
+        self._files = {name: open(os.path.join(self.folder, f"{name}.bin"), "wb")
+                       for name in {**SPAN_COLUMNS, **TRACE_COLUMNS}}
+        self.dictionaries = {"services": {}, "pods": {}, "operations": {}, "shapes": {}}
+        self.orphan_parents = {}
+        self.spans = self.traces = 0
+
+    def _remap(self, kind, names, codes):
+        merged = self.dictionaries[kind]
+        mapping = np.array([merged.setdefault(name, len(merged)) for name in names], dtype=np.int32)
+        return mapping[codes] if len(codes) else np.zeros(0, dtype=np.int32)
+
+    def _append(self, name, values):
+        dtype = SPAN_COLUMNS.get(name) or TRACE_COLUMNS[name]
+        np.ascontiguousarray(values, dtype=dtype).tofile(self._files[name])
+
+    def write(self, table: SpanTable):
+        if not table.num_traces:
+            return
+        shapes = table.trace_shapes if table.trace_shapes is not None else [t.shape for t in table.to_traces()]
+        shape_names = list(dict.fromkeys(shapes))
+        shape_codes = {shape: code for code, shape in enumerate(shape_names)}
+
+        self._append("trace_index", table.trace_index.astype(np.int64) + self.traces)
+        self._append("span_id", _span_id_bytes(table))
+        self._append("parent_index", np.where(table.parent_index >= 0, table.parent_index + self.spans, -1))
+        self._append("has_parent", table.has_parent)
+        self._append("start_time", table.start_time)
+        self._append("duration", table.duration)
+        self._append("service_code", self._remap("services", table.services, table.service_code))
+        self._append("pod_code", self._remap("pods", table.pods, table.pod_code))
+        self._append("operation_code", self._remap("operations", table.operations, table.operation_code))
+
+        self._append("trace_id", _fixed_bytes(table.trace_ids, TRACE_COLUMNS["trace_id"]))
+        self._append("trace_offset", table.trace_offsets[:-1] + self.spans)
+        self._append("trace_start", table.trace_start_times())
+        self._append("trace_duration", table.total_durations())
+        self._append("shape_code", self._remap("shapes", shape_names,
+                                               np.array([shape_codes[shape] for shape in shapes], dtype=np.int32)))
+
+        self.orphan_parents.update((str(row + self.spans), parent_id) for row, parent_id in table.orphan_parents.items())
+        self.spans += len(table)
+        self.traces += table.num_traces
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        meta = {
+            "spans": self.spans,
+            "traces": self.traces,
+            "columns": {**SPAN_COLUMNS, **TRACE_COLUMNS},
+            "orphan_parents": self.orphan_parents,
+        }
+        meta.update({kind: list(names) for kind, names in self.dictionaries.items()})
+        write_json_atomic(os.path.join(self.folder, META_FILE), meta)
+        print(f"✅ {self.traces} 条 traces（{self.spans} 个 span）已写入 {self.folder}")
+
+class SpanMmap:
+    """
+    span_mmap 目录的只读视图：每列都是 np.memmap，打开时不读取数据。
+    统计函数按 block_rows 行一块扫描，常驻内存只与块大小有关，与 span 总数无关；
+    start_time / end_time 参数按所属 trace 的开始时间过滤（微秒，[start_time, end_time)）
+    """
+
+    def __init__(self, folder, block_rows=BLOCK_ROWS):
+        with open(os.path.join(folder, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.block_rows = block_rows
+        self.services, self.pods = self.meta["services"], self.meta["pods"]
+        self.operations, self.shapes = self.meta["operations"], self.meta["shapes"]
+        for name, dtype in self.meta["columns"].items():
+            length = self.meta["spans"] if name in SPAN_COLUMNS else self.meta["traces"]
+            path = os.path.join(folder, f"{name}.bin")
+            column = np.memmap(path, dtype=dtype, mode="r", shape=(length,)) if length else np.zeros(0, dtype=dtype)
+            setattr(self, name, column)
+
+    def __len__(self):
+        return self.meta["spans"]
+
+    @property
+    def num_traces(self):
+        return self.meta["traces"]
+
+    def _blocks(self, length):
+        for begin in range(0, length, self.block_rows):
+            yield begin, min(begin + self.block_rows, length)
+
+    def _span_mask(self, begin, end, start_time, end_time):
+        # 一块 span 所属的 trace 是连续的一段，只需读取这一段的 trace_start
+        if start_time is None and end_time is None:
+            return None
+        trace_index = self.trace_index[begin:end]
+        first = int(trace_index[0])
+        trace_start = np.asarray(self.trace_start[first:int(trace_index[-1]) + 1])[trace_index - first]
+        return self._window(trace_start, start_time, end_time)
+
+    @staticmethod
+    def _window(values, start_time, end_time):
+        mask = np.ones(len(values), dtype=bool)
+        if start_time is not None:
+            mask &= values >= start_time
+        if end_time is not None:
+            mask &= values < end_time
+        return mask
+
+    def counts(self, level="pod", start_time=None, end_time=None):
+        """
+        各服务 / pod / operation 的 span 数
+        :param level: service、pod 或 operation
+        """
+        names = getattr(self, LEVELS[level])
+        codes = getattr(self, f"{level}_code")
+        total = np.zeros(len(names), dtype=np.int64)
+        for begin, end in self._blocks(len(self)):
+            block = np.asarray(codes[begin:end])
+            mask = self._span_mask(begin, end, start_time, end_time)
+            total += np.bincount(block if mask is None else block[mask], minlength=len(names))
+        return {name: int(count) for name, count in zip(names, total) if count}
+
+    def duration_sums(self, level="pod", start_time=None, end_time=None):
+        """
+        各服务 / pod / operation 的 span 总耗时（微秒）
+        """
+        names = getattr(self, LEVELS[level])
+        codes = getattr(self, f"{level}_code")
+        total = np.zeros(len(names), dtype=np.float64)
+        for begin, end in self._blocks(len(self)):
+            block, duration = np.asarray(codes[begin:end]), np.asarray(self.duration[begin:end])
+            mask = self._span_mask(begin, end, start_time, end_time)
+            if mask is not None:
+                block, duration = block[mask], duration[mask]
+            total += np.bincount(block, weights=duration, minlength=len(names))
+        return {name: int(value) for name, value in zip(names, total) if value}
+
+    def duration_histogram(self, bins, level="trace", start_time=None, end_time=None):
+        """
+        耗时直方图
+        :param bins: 分桶边界（微秒）
+        :param level: trace 为端到端耗时，span 为单个 span 的耗时
+        """
+        bins = np.asarray(bins)
+        hist = np.zeros(len(bins) - 1, dtype=np.int64)
+        if level == "trace":
+            for begin, end in self._blocks(self.num_traces):
+                durations = np.asarray(self.trace_duration[begin:end])
+                if start_time is not None or end_time is not None:
+                    durations = durations[self._window(np.asarray(self.trace_start[begin:end]), start_time, end_time)]
+                hist += np.histogram(durations, bins)[0]
+        else:
+            for begin, end in self._blocks(len(self)):
+                durations = np.asarray(self.duration[begin:end])
+                mask = self._span_mask(begin, end, start_time, end_time)
+                hist += np.histogram(durations if mask is None else durations[mask], bins)[0]
+        return hist
+
+    def duration_cdf(self, bins=None, level="trace", start_time=None, end_time=None):
+        """
+        分桶近似的耗时 CDF，默认按对数等分 1000 个桶（相对误差约 2%）
+        :return: (桶的右边界, 累计比例)
+        """
+        if bins is None:
+            column = self.trace_duration if level == "trace" else self.duration
+            high = max((int(np.asarray(column[b:e]).max()) for b, e in self._blocks(len(column))), default=1)
+            bins = np.concatenate([[0], np.geomspace(1, max(high, 1) + 1, 1000)])
+        hist = self.duration_histogram(bins, level, start_time, end_time)
+        total = hist.sum()
+        return np.asarray(bins)[1:], np.cumsum(hist) / total if total else np.zeros(len(hist))
+
+    def quantiles(self, qs, level="trace", start_time=None, end_time=None):
+        """
+        由 duration_cdf 得到近似分位数（微秒）
+        """
+        edges, cdf = self.duration_cdf(level=level, start_time=start_time, end_time=end_time)
+        return [float(edges[min(np.searchsorted(cdf, q), len(edges) - 1)]) for q in qs]
+
+    def select_traces(self, start_time=None, end_time=None):
+        """
+        开始时间在 [start_time, end_time) 内的 trace 下标
+        """
+        selected = [begin + np.flatnonzero(self._window(np.asarray(self.trace_start[begin:end]), start_time, end_time))
+                    for begin, end in self._blocks(self.num_traces)]
+        return np.concatenate(selected) if selected else np.zeros(0, dtype=np.int64)
+
+    def to_span_table(self, trace_begin=0, trace_end=None) -> SpanTable:
+        """
+        把连续的一段 trace [trace_begin, trace_end) 读入内存，得到 SpanTable，用于关键路径等需要完整调用树的分析
+        """
+        trace_end = self.num_traces if trace_end is None else min(trace_end, self.num_traces)
+        if trace_begin >= trace_end:
+            return SpanTable.from_traces([])
+        row_begin = int(self.trace_offset[trace_begin])
+        row_end = int(self.trace_offset[trace_end]) if trace_end < self.num_traces else len(self)
+
+        parent_index = np.asarray(self.parent_index[row_begin:row_end])
+        orphan_parents = {int(row) - row_begin: parent_id for row, parent_id in self.meta["orphan_parents"].items()
+                          if row_begin <= int(row) < row_end}
+        span_ids = SpanTable._encode_ids([span_id.decode() for span_id in self.span_id[row_begin:row_end]])
+        return SpanTable(
+            [trace_id.decode() for trace_id in self.trace_id[trace_begin:trace_end]],
+            np.append(np.asarray(self.trace_offset[trace_begin:trace_end]), row_end) - row_begin,
+            span_ids, np.where(parent_index >= 0, parent_index - row_begin, -1),
+            self.has_parent[row_begin:row_end], self.start_time[row_begin:row_end], self.duration[row_begin:row_end],
+            self.service_code[row_begin:row_end], self.pod_code[row_begin:row_end],
+            self.services or [""], self.pods or [""], orphan_parents,
+            self.operation_code[row_begin:row_end], self.operations or [""],
+            [self.shapes[code] for code in self.shape_code[trace_begin:trace_end]],
+        )
+
+def open_experiment(experiment_dir, block_rows=BLOCK_ROWS):
+    """
+    :return: {算法: SpanMmap}
+    """
+    return {algo: SpanMmap(mmap_dir(experiment_dir, algo), block_rows) for algo in list_algos(experiment_dir)}
+
+def convert_experiment(experiment_dir, workers=None, overwrite=False):
+    """
+    把实验目录下各算法的 trace 数据（trace_data.pkl.gz、trace_chunks、批次文件、trace_results.json）转换为 span_mmap，
+    各文件在进程池中并行解码，逐个文件写出
+    """
+    for algo in sorted(os.listdir(experiment_dir)):
+        algo_path = os.path.join(experiment_dir, algo)
+        if algo == MMAP_DIR or not os.path.isdir(algo_path):
+            continue
+        paths = parallel_loader.source_files(algo_path)
+        if not paths:
+            continue
+        if algo in list_algos(experiment_dir) and not overwrite:
+            print(f"⏭️ {algo} 已在 span_mmap 中，跳过")
+            continue
+
+        writer = SpanMmapWriter(experiment_dir, algo)
+        for table in parallel_loader.iter_tables(paths, workers):
+            writer.write(table)
+        writer.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="内存映射的定长列式 span 存储")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="把实验目录下的 trace 数据转换为 span_mmap")
+    convert.add_argument("experiment_dir")
+    convert.add_argument("--workers", type=int, default=None, help="解码进程数，默认为 CPU 核数")
+    convert.add_argument("--overwrite", action="store_true", help="重新转换已经存在的算法")
+    stats = sub.add_parser("stats", help="不加载数据，直接统计各算法的延迟分位数和 pod 调用次数")
+    stats.add_argument("experiment_dir")
+    stats.add_argument("--start", type=int, default=None, help="只统计开始时间不早于它的 trace（微秒）")
+    stats.add_argument("--end", type=int, default=None, help="只统计开始时间早于它的 trace（微秒）")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_experiment(args.experiment_dir, args.workers, args.overwrite)
+    else:
+        for algo, spans in open_experiment(args.experiment_dir).items():
+            p50, p90, p99 = spans.quantiles([0.5, 0.9, 0.99], start_time=args.start, end_time=args.end)
+            print(f"📊 {algo}: {spans.num_traces} 条 traces，{len(spans)} 个 span，"
+                  f"P50 {p50 / 1000:.2f} ms，P90 {p90 / 1000:.2f} ms，P99 {p99 / 1000:.2f} ms")
+            for pod, count in sorted(spans.counts("pod", args.start, args.end).items()):
+                print(f"   {pod}: {count}")
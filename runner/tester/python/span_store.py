@@ -0,0 +1,247 @@
+import argparse
+import os
+import shutil
+
+import numpy as np
+
+import parallel_loader
+from trace_model import SpanTable
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # 可选依赖：pip install pyarrow
+    pa = None
+
+STORE_DIR = "span_store"
+PART_FILE = "part-{:05d}.parquet"
+ROW_GROUP_SIZE = 1 << 20
+COMPRESSION = "zstd"
+
+# 每行一个 span，同一 trace 的 span 连续存放。服务名、pod、operation、traceID、结构指纹做字典编码；
+# 父 span 记为 trace 内的相对行号（-1 表示没有或不在本 trace 中），读取时不需要按 spanID 关联。
+# trace_start 是所属 trace 的开始时间，按时间范围过滤时整条 trace 一起保留或丢弃
+if pa is not None:
+    _dict = pa.dictionary(pa.int32(), pa.string())
+    SCHEMA = pa.schema([
+        ("trace_id", _dict),
+        ("trace_start", pa.int64()),
+        ("shape", _dict),
+        ("span_id", pa.string()),
+        ("parent_row", pa.int32()),
+        ("has_parent", pa.bool_()),
+        ("orphan_parent", pa.string()),
+        ("start_time", pa.int64()),
+        ("duration", pa.int64()),
+        ("service", _dict),
+        ("pod", _dict),
+        ("operation", _dict),
+    ])
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("span_store 需要 pyarrow：pip install pyarrow")
+
+def store_dir(experiment_dir):
+    return os.path.join(experiment_dir, STORE_DIR)
+
+def partition_dir(experiment_dir, algo):
+    return os.path.join(store_dir(experiment_dir), f"algo={algo}")
+
+def list_algos(experiment_dir):
+    root = store_dir(experiment_dir)
+    if pa is None or not os.path.isdir(root):
+        return []
+    return sorted(name[len("algo="):] for name in os.listdir(root)
+                  if name.startswith("algo=") and os.path.isfile(os.path.join(root, name, PART_FILE.format(0))))
+
+def has_algo(experiment_dir, algo):
+    return algo in list_algos(experiment_dir)
+
+def _dictionary(codes, names):
+    return pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.int32()), pa.array(names, type=pa.string()))
+
+def to_arrow(table: SpanTable):
+    """
+    SpanTable 转换为 Arrow 表，字典编码列直接复用 SpanTable 中的编码，不需要重新编码
+    """
+    _require_pyarrow()
+    trace_starts = table.trace_start_times()
+    relative_parent = np.where(table.parent_index >= 0,
+                               table.parent_index - table.trace_offsets[:-1][table.trace_index], -1)
+    orphan_parent = [None] * len(table)
+    for row, parent_id in table.orphan_parents.items():
+        orphan_parent[row] = parent_id
+    shapes = table.trace_shapes if table.trace_shapes is not None else [t.shape for t in table.to_traces()]
+    shape_names = list(dict.fromkeys(shapes))
+    shape_codes = {shape: code for code, shape in enumerate(shape_names)}
+
+    return pa.Table.from_arrays([
+        _dictionary(table.trace_index, table.trace_ids),
+        pa.array(trace_starts[table.trace_index], type=pa.int64()),
+        _dictionary(np.array([shape_codes[shape] for shape in shapes], dtype=np.int32)[table.trace_index],
+                    shape_names),
+        pa.array([table._decode_id(row) for row in range(len(table))], type=pa.string()),
+        pa.array(relative_parent, type=pa.int32()),
+        pa.array(table.has_parent),
+        pa.array(orphan_parent, type=pa.string()),
+        pa.array(table.start_time),
+        pa.array(table.duration),
+        _dictionary(table.service_code, table.services),
+        _dictionary(table.pod_code, table.pods),
+        _dictionary(table.operation_code, table.operations),
+    ], schema=SCHEMA)
+
+def _categorical(column):
+    values = column.to_pandas()
+    return values.cat.codes.to_numpy(dtype=np.int32), list(values.cat.categories)
+
+def from_arrow(arrow_table) -> SpanTable:
+    """
+    由按 to_arrow 格式读出的 Arrow 表（可以是过滤后的，但必须保留整条 trace）重建 SpanTable
+    """
+    if arrow_table.num_rows == 0:
+        return SpanTable.from_traces([])
+
+    trace_codes, trace_names = _categorical(arrow_table.column("trace_id"))
+    starts = np.flatnonzero(np.diff(trace_codes)) + 1
+    trace_offsets = np.concatenate([[0], starts, [len(trace_codes)]]).astype(np.int64)
+    first_rows = trace_offsets[:-1]
+    trace_ids = [trace_names[code] for code in trace_codes[first_rows]]
+    trace_index = np.repeat(np.arange(len(first_rows)), np.diff(trace_offsets))
+
+    relative_parent = arrow_table.column("parent_row").to_numpy().astype(np.int64)
+    parent_index = np.where(relative_parent >= 0, relative_parent + first_rows[trace_index], -1)
+    orphan_parents = {row: parent_id for row, parent_id in enumerate(arrow_table.column("orphan_parent").to_pylist())
+                      if parent_id is not None}
+
+    shape_codes, shape_names = _categorical(arrow_table.column("shape"))
+    trace_shapes = [shape_names[code] for code in shape_codes[first_rows]]
+    service_code, services = _categorical(arrow_table.column("service"))
+    pod_code, pods = _categorical(arrow_table.column("pod"))
+    operation_code, operations = _categorical(arrow_table.column("operation"))
+
+    span_ids = SpanTable._encode_ids(arrow_table.column("span_id").to_pylist())
+    return SpanTable(trace_ids, trace_offsets, span_ids, parent_index,
+                     arrow_table.column("has_parent").to_numpy(zero_copy_only=False),
+                     arrow_table.column("start_time").to_numpy(), arrow_table.column("duration").to_numpy(),
+                     service_code, pod_code, services or [""], pods or [""], orphan_parents,
+                     operation_code, operations or [""], trace_shapes)
+
+class SpanStoreWriter:
+    """
+    把一个算法的 SpanTable 依次追加写入 {experiment_dir}/span_store/algo={algo}/part-00000.parquet，
+    每次 write 只在内存中保留当前这一批。先写到以 . 开头的临时文件（读取数据集时会忽略），close 时再替换，
+    写到一半退出不会留下损坏的分区
+    """
+
+    def __init__(self, experiment_dir, algo, row_group_size=ROW_GROUP_SIZE):
+        _require_pyarrow()
+        self.algo_dir = partition_dir(experiment_dir, algo)
+        os.makedirs(self.algo_dir, exist_ok=True)
+        self.path = os.path.join(self.algo_dir, PART_FILE.format(0))
+        self.tmp_path = os.path.join(self.algo_dir, f".{PART_FILE.format(0)}.tmp")
+        self.row_group_size = row_group_size
+        self._writer = pq.ParquetWriter(self.tmp_path, SCHEMA, compression=COMPRESSION)
+        self.traces = self.spans = 0
+
+    def write(self, table: SpanTable):
+        if not table.num_traces:
+            return
+        self._writer.write_table(to_arrow(table), row_group_size=self.row_group_size)
+        self.traces += table.num_traces
+        self.spans += len(table)
+
+    def close(self):
+        self._writer.close()
+        os.replace(self.tmp_path, self.path)
+        print(f"✅ {self.traces} 条 traces（{self.spans} 个 span）已写入 {self.algo_dir}")
+
+    def abort(self):
+        self._writer.close()
+        os.remove(self.tmp_path)
+
+def read_spans(experiment_dir, algos=None, columns=None, filter=None):
+    """
+    按列、按条件读取 span 数据集，只读取需要的列；filter 会下推到 Parquet 的 row group 统计信息，
+    不满足条件的 row group 不会被读取
+    :param algos: 只读取这些算法，默认全部
+    :param columns: 需要的列，默认全部；结果中始终带 algo 列
+    :param filter: pyarrow.dataset 表达式，例如 ds.field("service") == "frontend"
+    :return: pyarrow.Table
+    """
+    _require_pyarrow()
+    dataset = ds.dataset(store_dir(experiment_dir), format="parquet", partitioning="hive",
+                         schema=SCHEMA.append(pa.field("algo", pa.string())))
+    if algos is not None:
+        algo_filter = ds.field("algo").isin(list(algos))
+        filter = algo_filter if filter is None else filter & algo_filter
+    if columns is not None and "algo" not in columns:
+        columns = list(columns) + ["algo"]
+    return dataset.to_table(columns=columns, filter=filter)
+
+def load_span_table(experiment_dir, algo, start_time=None, end_time=None) -> SpanTable:
+    """
+    读取一个算法的 SpanTable，可以只读取开始时间在 [start_time, end_time) 内的 trace（微秒）
+    """
+    condition = None
+    for expr in ((ds.field("trace_start") >= start_time) if start_time is not None else None,
+                 (ds.field("trace_start") < end_time) if end_time is not None else None):
+        if expr is not None:
+            condition = expr if condition is None else condition & expr
+    return from_arrow(read_spans(experiment_dir, [algo], columns=SCHEMA.names, filter=condition))
+
+def load_all_tables(experiment_dir) -> dict:
+    """
+    :return: {算法: SpanTable}，只包含已写入 span_store 的算法
+    """
+    return {algo: load_span_table(experiment_dir, algo) for algo in list_algos(experiment_dir)}
+
+def convert_experiment(experiment_dir, workers=None, overwrite=False):
+    """
+    把实验目录下各算法已有的 trace 文件（trace_data.pkl.gz、trace_chunks、批次文件、trace_results.json）
+    转换为 span_store。各文件在进程池中并行解码，按文件顺序流式写入
+    :param overwrite: 已经转换过的算法是否重新转换
+    """
+    _require_pyarrow()
+    for algo in sorted(os.listdir(experiment_dir)):
+        algo_path = os.path.join(experiment_dir, algo)
+        if algo == STORE_DIR or not os.path.isdir(algo_path):
+            continue
+        paths = parallel_loader.source_files(algo_path)
+        if not paths:
+            continue
+        if has_algo(experiment_dir, algo):
+            if not overwrite:
+                print(f"⏭️ {algo} 已在 span_store 中，跳过")
+                continue
+            shutil.rmtree(partition_dir(experiment_dir, algo))
+
+        writer = SpanStoreWriter(experiment_dir, algo)
+        try:
+            for table in parallel_loader.iter_tables(paths, workers):
+                writer.write(table)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parquet 列式 span 存储")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="把实验目录下的 pkl.gz / chunk / JSON 数据转换为 span_store")
+    convert.add_argument("experiment_dir")
+    convert.add_argument("--workers", type=int, default=None, help="解码进程数，默认为 CPU 核数")
+    convert.add_argument("--overwrite", action="store_true", help="重新转换已经存在的算法")
+    info = sub.add_parser("info", help="查看 span_store 中各算法的 trace / span 数")
+    info.add_argument("experiment_dir")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_experiment(args.experiment_dir, args.workers, args.overwrite)
+    else:
+        spans = read_spans(args.experiment_dir, columns=["trace_id"])
+        for algo in list_algos(args.experiment_dir):
+            trace_ids = spans.filter(ds.field("algo") == algo).column("trace_id")
+            print(f"📊 {algo}: {len(trace_ids.unique())} 条 traces，{len(trace_ids)} 个 span")
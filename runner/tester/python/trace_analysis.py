@@ -0,0 +1,153 @@
+import os
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from trace_model import SpanTable
+from trace_store import load_shape_index
+from parallel_loader import load_all_tables_from_experiment
+import span_store
+
+def _as_table(traces):
+    return traces if isinstance(traces, SpanTable) else SpanTable.from_traces(traces)
+
+def _breakdown(table, times):
+    by_service = np.bincount(table.service_code, weights=times, minlength=len(table.services))
+    by_pod = np.bincount(table.pod_code, weights=times, minlength=len(table.pods))
+    return {
+        "traces": table.num_traces,
+        "spans": len(table),
+        "total_us": int(times.sum()),
+        "service": dict(zip(table.services, by_service.astype(np.int64).tolist())),
+        "pod": dict(zip(table.pods, by_pod.astype(np.int64).tolist())),
+        "service_spans": table.service_counts(),
+        "pod_spans": table.pod_counts(),
+    }
+
+def critical_path_breakdown(traces):
+    """
+    统计一批 traces 的关键路径时间分别落在哪些服务、哪些 pod 上
+    :param traces: Trace 可迭代对象（列表、TraceChunks）或 SpanTable
+    :return: {"traces", "spans", "total_us": 关键路径总时间, "service": {服务: 微秒}, "pod": {pod: 微秒},
+              "service_spans" / "pod_spans": 各服务 / pod 的 span 数}
+    """
+    table = _as_table(traces)
+    return _breakdown(table, table.critical_path_times())
+
+def self_time_breakdown(traces):
+    """
+    统计一批 traces 中各服务、各 pod 的自身耗时（不含子调用），格式同 critical_path_breakdown
+    """
+    table = _as_table(traces)
+    return _breakdown(table, table.self_times())
+
+def _compare(algo_trace_dict, breakdown_func):
+    """
+    按算法汇总各服务 / pod 的时间
+    :return: 每行一个 (algo, level, name)，level 为 service 或 pod；total_us 为总时间，
+             per_trace_us 为平均每条 trace 的时间，per_span_us 为该服务 / pod 平均每个 span 的时间，
+             share 为占该算法总时间的比例
+    """
+    rows = []
+    for algo, traces in algo_trace_dict.items():
+        breakdown = breakdown_func(traces)
+        if not breakdown["traces"]:
+            continue
+        for level in ("service", "pod"):
+            for name, total_us in breakdown[level].items():
+                rows.append({
+                    "algo": algo,
+                    "level": level,
+                    "name": name,
+                    "total_us": total_us,
+                    "per_trace_us": total_us / breakdown["traces"],
+                    "per_span_us": total_us / breakdown[f"{level}_spans"][name],
+                    "share": total_us / breakdown["total_us"] if breakdown["total_us"] else 0.0,
+                })
+    return pd.DataFrame(rows, columns=["algo", "level", "name", "total_us", "per_trace_us", "per_span_us", "share"])
+
+def compare_critical_paths(algo_trace_dict: dict) -> pd.DataFrame:
+    """
+    按算法汇总关键路径时间，列含义见 _compare
+    :param algo_trace_dict: {算法: Trace 可迭代对象或 SpanTable}
+    """
+    return _compare(algo_trace_dict, critical_path_breakdown)
+
+def compare_self_times(algo_trace_dict: dict) -> pd.DataFrame:
+    """
+    按算法汇总自身耗时，per_span_us 即每个 pod 平均每次调用实际消耗的时间
+    """
+    return _compare(algo_trace_dict, self_time_breakdown)
+
+def compare_shapes(algo_shape_indexes: dict, min_count: int = 1) -> pd.DataFrame:
+    """
+    按调用结构比较各算法的端到端延迟，同一结构的 trace 做的是同样的工作，比较结果不受请求类型比例的影响
+    :param algo_shape_indexes: {算法: ShapeIndex}
+    :param min_count: 某个算法下 trace 数少于它的结构不输出
+    :return: 每行一个 (shape, algo)，含 services、count、mean_us、p50_us、p90_us、p99_us
+    """
+    rows = []
+    for algo, index in algo_shape_indexes.items():
+        for shape, count in index.counts().items():
+            if count < min_count:
+                continue
+            durations = index.durations(shape)
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+            rows.append({
+                "shape": shape,
+                "services": ",".join(index.services(shape)),
+                "algo": algo,
+                "count": count,
+                "mean_us": durations.mean(),
+                "p50_us": p50,
+                "p90_us": p90,
+                "p99_us": p99,
+            })
+    return pd.DataFrame(rows, columns=["shape", "services", "algo", "count", "mean_us", "p50_us", "p90_us", "p99_us"])
+
+def plot_breakdown_by_service(df: pd.DataFrame, fig_dir: str, filename: str, title: str):
+    """
+    每个算法一根柱子，按服务堆叠平均每条 trace 的时间
+    """
+    services = df[df["level"] == "service"].pivot(index="algo", columns="name", values="per_trace_us").fillna(0)
+    if services.empty:
+        return
+
+    ax = (services / 1000).plot(kind="bar", stacked=True, figsize=(12, 6))
+    ax.set_xlabel("Algorithm")
+    ax.set_ylabel("Time per Trace (ms)")
+    ax.set_title(title)
+    ax.legend(bbox_to_anchor=(1.02, 1), loc="upper left")
+    plt.xticks(rotation=0)
+    plt.grid(axis="y")
+    os.makedirs(fig_dir, exist_ok=True)
+    plt.savefig(os.path.join(fig_dir, filename), dpi=300, bbox_inches="tight")
+    plt.close()
+    print(f"✅ 图已保存至: {os.path.join(fig_dir, filename)}")
+
+def main(experiment_dir, workers=None):
+    # 已转换到 span_store 的算法直接读 Parquet，其余的多进程加载；
+    # 每个算法只得到一个 SpanTable，关键路径、自身耗时和结构索引共用
+    algo_tables = span_store.load_all_tables(experiment_dir)
+    algo_tables.update(load_all_tables_from_experiment(experiment_dir, workers, skip=set(algo_tables)))
+    fig_dir = experiment_dir.replace("data", "fig")
+    os.makedirs(fig_dir, exist_ok=True)
+
+    for name, compare, title in [
+        ("critical_path", compare_critical_paths, "Critical Path Breakdown by Service"),
+        ("self_time", compare_self_times, "Self Time Breakdown by Service"),
+    ]:
+        df = compare(algo_tables)
+        csv_path = os.path.join(fig_dir, f"{name}.csv")
+        df.to_csv(csv_path, index=False)
+        print(f"✅ 统计结果已保存至: {csv_path}")
+        plot_breakdown_by_service(df, fig_dir, f"{name}_by_service.pdf", title)
+
+    algo_shape_indexes = {algo: load_shape_index(os.path.join(experiment_dir, algo), table)
+                          for algo, table in algo_tables.items()}
+    csv_path = os.path.join(fig_dir, "shape_latency.csv")
+    compare_shapes(algo_shape_indexes).to_csv(csv_path, index=False)
+    print(f"✅ 按调用结构的延迟统计已保存至: {csv_path}")
+
+if __name__ == "__main__":
+    experiment_dir = "data/onlineBoutique/1744278530113530"
+    main(experiment_dir)
@@ -1,25 +1,153 @@
-__all__ = ["Trace", "Span"]
+import hashlib
+import pickle
+import sys
+
+import numpy as np
+
+__all__ = ["Trace", "Span", "SpanTable", "shape_hash"]
+
+def shape_hash(nodes):
+    """
+    trace 调用树的结构指纹：每个节点由 (服务名, operation) 和子树指纹（排序后）哈希得到，
+    与 span 的顺序、时间、pod 无关，结构相同的 trace 得到相同的值。自底向上每个节点只哈希一次
+    :param nodes: (span_id, parent_id, service_name, operation) 的可迭代对象；父 span 不在其中的节点视为根
+    :return: 16 位十六进制字符串
+    """
+    nodes = list(nodes)
+    index = {node[0]: i for i, node in enumerate(nodes)}
+    children = [[] for _ in nodes]
+    roots = []
+    for i, (_, parent_id, _, _) in enumerate(nodes):
+        parent = index.get(parent_id) if parent_id else None
+        if parent is None:
+            roots.append(i)
+        else:
+            children[parent].append(i)
+
+    # 从根开始广度优先得到遍历顺序，倒序处理保证子节点先于父节点
+    order = list(roots)
+    for i in order:
+        order.extend(children[i])
+
+    digests = [b""] * len(nodes)
+    for i in reversed(order):
+        _, _, service_name, operation = nodes[i]
+        h = hashlib.blake2b(f"{service_name}\x1f{operation}\x00".encode(), digest_size=8)
+        for digest in sorted(digests[child] for child in children[i]):
+            h.update(digest)
+        digests[i] = h.digest()
+
+    h = hashlib.blake2b(digest_size=8)
+    for digest in sorted(digests[root] for root in roots):
+        h.update(digest)
+    return h.hexdigest()
 
 class Span:
+    # 单个实验有上百万个 span，用 __slots__ 去掉每个实例的 __dict__；
+    # children 不单独存列表，而是所属 Trace._child_spans 中的一段 [_first, _last)
+    __slots__ = ("span_id", "parent_id", "start_time", "duration", "pod_id", "service_name", "operation",
+                 "_trace", "_first", "_last")
+
     def __init__(self, span_json: dict, service_name: str):
-        self.span_id = span_json["spanID"]
-        self.parent_id = span_json["references"][0]["spanID"] if span_json.get("references") else None
-        self.start_time = span_json["startTime"]
-        self.duration = span_json["duration"]
-        self.end_time = self.start_time + self.duration
-        self.pod_id = self._extract_pod_id(span_json.get("tags", []))
-        self.service_name = service_name
-        self.children = []
-
-    def _extract_pod_id(self, tags):
+        self.__setstate__(self.state_from_json(span_json, service_name))
+
+    @staticmethod
+    def _extract_pod_id(tags):
         for tag in tags:
             if tag.get("key") == "node_id":
                 parts = tag["value"].split("~")
                 return parts[2] if len(parts) > 2 else "unknown"
         return "unknown"
 
+    @classmethod
+    def from_state(cls, state):
+        """
+        由 (span_id, parent_id, start_time, duration, pod_id, service_name, operation) 直接构造 Span
+        """
+        span = cls.__new__(cls)
+        span.__setstate__(state)
+        return span
+
+    @staticmethod
+    def state_from_json(span_json: dict, service_name: str):
+        """
+        从 Jaeger span dict 中取出 Span 需要的字段，格式与 __getstate__ 相同
+        """
+        return (span_json["spanID"],
+                span_json["references"][0]["spanID"] if span_json.get("references") else None,
+                span_json["startTime"],
+                span_json["duration"],
+                Span._extract_pod_id(span_json.get("tags", [])),
+                service_name,
+                span_json.get("operationName", ""))
+
+    @property
+    def end_time(self):
+        return self.start_time + self.duration
+
+    @property
+    def children(self):
+        # 返回只读元组（所属 Trace._child_spans 的一段），添加子 span 用 add_child
+        trace = self._trace
+        if trace is None:
+            return ()
+        if trace._child_spans is None:
+            trace._link_spans()
+        return trace._child_spans[self._first:self._last]
+
+    @property
+    def self_time(self):
+        """
+        自身耗时：duration 减去所有子 span 区间（裁剪到本 span 内）的并集长度。
+        子 span 按开始时间排序后扫描一遍，并发的子 span 重叠部分只扣一次
+        """
+        covered = 0
+        cursor = self.start_time
+        end_time = self.end_time
+        for child in sorted(self.children, key=lambda c: c.start_time):
+            begin = max(child.start_time, cursor)
+            end = min(child.end_time, end_time)
+            if end > begin:
+                covered += end - begin
+                cursor = end
+        return self.duration - covered
+
     def add_child(self, child: 'Span'):
-        self.children.append(child)
+        """
+        把 child 挂到本 span 下。父子关系由所属 Trace 统一建立：这里只修改 parent_id，
+        child 还不在这条 trace 中时追加到 trace.spans，然后把索引标记为失效，
+        下次访问 children 时整条 trace 重建一次，连续 add_child 建树不会每次都重建
+        """
+        trace = self._trace
+        if trace is None:
+            raise ValueError(f"span {self.span_id} 不属于任何 Trace，无法添加子 span")
+        if child._trace is not None and child._trace is not trace:
+            raise ValueError(f"span {child.span_id} 属于另一条 Trace，不能直接挂到 {self.span_id} 下")
+        child.parent_id = self.span_id
+        if child._trace is None:
+            child._trace = trace
+            trace._spans.append(child)
+            trace._span_map = None
+        trace._child_spans = None
+        trace._shape = None
+
+    def __getstate__(self):
+        return (self.span_id, self.parent_id, self.start_time, self.duration, self.pod_id, self.service_name,
+                self.operation)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # 旧版本保存的 pickle（实例 __dict__），children 由 Trace.__setstate__ 重建
+            state = tuple(state.get(key, "") for key in ("span_id", "parent_id", "start_time", "duration",
+                                                         "pod_id", "service_name", "operation"))
+        # 没有 operation 字段的旧数据按空字符串处理
+        self.span_id, self.parent_id, self.start_time, self.duration, pod_id, service_name, operation = \
+            state if len(state) > 6 else (*state, "")
+        self.pod_id = sys.intern(pod_id)
+        self.service_name = sys.intern(service_name)
+        self.operation = sys.intern(operation)
+        self._trace = None
+        self._first = self._last = 0
 
     def to_dict(self):
         return {
@@ -33,32 +161,193 @@ class Span:
         }
 
 class Trace:
-    def __init__(self, trace_wrapper: dict):
+    __slots__ = ("trace_id", "service_map", "_spans", "_child_spans", "_span_map", "total_duration", "start_time",
+                 "_lazy", "_raw_spans", "_span_blob", "_shape")
+
+    def __init__(self, trace_wrapper: dict, lazy: bool = False):
+        """
+        :param lazy: 惰性解析：构造时只遍历一遍原始 span dict 算出 total_duration 和 start_time，
+                     第一次访问 spans / root_spans 等时才创建 Span 对象并建立父子关系。
+                     惰性 Trace 保存为 pickle 时 spans 单独序列化成一段字节，加载后同样在访问时才解析，
+                     只用到 total_duration / start_time 的统计可以跳过全部 span 的反序列化
+        """
         trace_data = trace_wrapper["data"][0]
         self.trace_id = trace_data["traceID"]
-        self.service_map = {pid: info.get("serviceName", "unknown") for pid, info in trace_data["processes"].items()}
+        self.service_map = {pid: sys.intern(info.get("serviceName", "unknown"))
+                            for pid, info in trace_data["processes"].items()}
+        self._lazy = lazy
+        self._raw_spans = self._span_blob = self._span_map = None
 
-        self.spans = []
-        self.span_map = {}
+        if lazy:
+            self._spans = None
+            self._raw_spans = trace_data["spans"]
+            self._shape = shape_hash(
+                (span_json["spanID"],
+                 span_json["references"][0]["spanID"] if span_json.get("references") else None,
+                 self.service_map[span_json["processID"]],
+                 span_json.get("operationName", ""))
+                for span_json in self._raw_spans
+            )
+            start_time = end_time = None
+            for span_json in self._raw_spans:
+                span_start = span_json["startTime"]
+                span_end = span_start + span_json["duration"]
+                if start_time is None or span_start < start_time:
+                    start_time = span_start
+                if end_time is None or span_end > end_time:
+                    end_time = span_end
+            self.start_time = start_time or 0
+            self.total_duration = end_time - start_time if start_time is not None else 0
+            return
 
-        self._parse_spans(trace_data["spans"])
-        self.root_spans = [s for s in self.spans if s.parent_id is None]
+        self._spans = [Span(span_json, self.service_map[span_json["processID"]])
+                       for span_json in trace_data["spans"]]
+        self._link_spans()
+        self._shape = shape_hash((s.span_id, s.parent_id, s.service_name, s.operation) for s in self._spans)
 
         self.total_duration = self._get_total_duration()
         self.start_time = min(s.start_time for s in self.spans) if self.spans else 0
 
-    def _parse_spans(self, span_data_list):
-        # 解析 spans
-        for span_json in span_data_list:
-            svc_name = self.service_map[span_json["processID"]]
-            span = Span(span_json, svc_name)
-            self.spans.append(span)
-            self.span_map[span.span_id] = span
+    @property
+    def spans(self):
+        if self._spans is None:
+            self._materialize()
+        return self._spans
+
+    @spans.setter
+    def spans(self, spans):
+        self._spans = spans
+        self._raw_spans = self._span_blob = None
+        self._link_spans()
+
+    @property
+    def shape(self):
+        """
+        调用树的结构指纹（见 shape_hash），构造时计算并随 trace 一起保存
+        """
+        if self._shape is None:
+            self._shape = shape_hash((s.span_id, s.parent_id, s.service_name, s.operation) for s in self.spans)
+        return self._shape
+
+    @property
+    def is_materialized(self):
+        return self._spans is not None
 
-        # 处理 spans 的父子关系
-        for span in self.spans:
-            if span.parent_id and span.parent_id in self.span_map:
-                self.span_map[span.parent_id].add_child(span)
+    @property
+    def is_empty(self):
+        """
+        是否没有任何 span。惰性 / 打包的 trace 不解码 spans：没有 span 的 trace 构造时 start_time 和 total_duration 都记为 0
+        """
+        if self._spans is not None:
+            return not self._spans
+        if self._raw_spans is not None:
+            return not self._raw_spans
+        return not self.start_time and not self.total_duration
+
+    def _span_states(self):
+        if self._spans is not None:
+            return [span.__getstate__() for span in self._spans]
+        if self._span_blob is not None:
+            return pickle.loads(self._span_blob)
+        return [Span.state_from_json(span_json, self.service_map[span_json["processID"]])
+                for span_json in self._raw_spans]
+
+    def pack(self):
+        """
+        把 spans 序列化成一段紧凑的字节串，释放 Span 对象和原始 span dict（之后按惰性 Trace 保存和加载）。
+        再次访问 spans 时从字节串解析，适合拉取后直接落盘的 traces
+        :return: self
+        """
+        self._span_blob = pickle.dumps(self._span_states(), protocol=pickle.HIGHEST_PROTOCOL)
+        self._lazy = True
+        # 已经取出的 Span 对象与 trace 脱离，不再指向被释放的 _child_spans
+        for span in self._spans or ():
+            span._trace = None
+        self._spans = self._raw_spans = self._child_spans = self._span_map = None
+        return self
+
+    def _materialize(self):
+        self.spans = [Span.from_state(state) for state in self._span_states()]
+
+    @classmethod
+    def from_span_states(cls, trace_id, service_map, span_states, lazy=False):
+        """
+        由已经解析好的 span 字段（格式同 Span.__getstate__）构造 Trace，不经过 Jaeger JSON dict
+        :param lazy: 为 True 时直接得到打包好的惰性 Trace（同 pack()）
+        """
+        trace = cls.__new__(cls)
+        trace.trace_id = trace_id
+        trace.service_map = service_map
+        trace._raw_spans = trace._span_blob = trace._child_spans = trace._span_map = None
+        trace._lazy = lazy
+        trace._shape = shape_hash((state[0], state[1], state[5], state[6]) for state in span_states)
+        if span_states:
+            trace.start_time = min(state[2] for state in span_states)
+            trace.total_duration = max(state[2] + state[3] for state in span_states) - trace.start_time
+        else:
+            trace.start_time = trace.total_duration = 0
+
+        if lazy:
+            trace._spans = None
+            trace._span_blob = pickle.dumps(span_states, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            trace.spans = [Span.from_state(state) for state in span_states]
+        return trace
+
+    @property
+    def span_map(self):
+        # 第一次访问时建立并缓存（大多数 trace 用不到，不常驻内存），spans 被替换时失效
+        if self._span_map is None:
+            self._span_map = {span.span_id: span for span in self.spans}
+        return self._span_map
+
+    @property
+    def root_spans(self):
+        return [s for s in self.spans if s.parent_id is None]
+
+    def _link_spans(self):
+        # 处理 spans 的父子关系：按父 span 分组后依次排进 _child_spans，每个 span 记录自己那一段的起止下标
+        span_map = {span.span_id: span for span in self._spans}
+        self._span_map = None
+        children_of = {}
+        for span in self._spans:
+            parent = span_map.get(span.parent_id) if span.parent_id else None
+            if parent is not None:
+                span.parent_id = parent.span_id  # 与父 span 共用同一个字符串对象
+                children_of.setdefault(id(parent), []).append(span)
+
+        child_spans = []
+        for span in self._spans:
+            span._trace = self
+            span._first = len(child_spans)
+            child_spans.extend(children_of.get(id(span), ()))
+            span._last = len(child_spans)
+        self._child_spans = tuple(child_spans)
+
+    def __getstate__(self):
+        if self._lazy:
+            # 惰性 Trace 的 spans 单独序列化，加载时不解析
+            span_blob = self._span_blob
+            if span_blob is None:
+                span_blob = pickle.dumps(self._span_states(), protocol=pickle.HIGHEST_PROTOCOL)
+            return self.trace_id, self.service_map, None, self.total_duration, self.start_time, span_blob, self.shape
+        return self.trace_id, self.service_map, self.spans, self.total_duration, self.start_time, None, self.shape
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # 旧版本保存的 pickle，span_map、root_spans 等冗余字段直接丢弃
+            state = tuple(state[key] for key in ("trace_id", "service_map", "spans", "total_duration", "start_time"))
+        self.trace_id, self.service_map, spans, self.total_duration, self.start_time = state[:5]
+        # 没有保存结构指纹的旧数据在第一次访问 shape 时计算
+        self._shape = state[6] if len(state) > 6 else None
+        self._raw_spans = self._span_map = None
+        if len(state) > 5 and state[5] is not None:
+            self._lazy = True
+            self._spans = None
+            self._span_blob = state[5]
+        else:
+            self._lazy = False
+            self.spans = spans
 
     def _get_total_duration(self):
         if not self.spans:
@@ -80,6 +369,55 @@ class Trace:
                 })
         return result
 
+    def critical_path(self):
+        """
+        计算 trace 的关键路径：从结束时间最晚的根 span 开始，由后往前找每一时刻父 span 在等待的子 span。
+        子 span 按结束时间从晚到早处理，结束最晚的子 span 阻塞了父 span 的结束，其开始时间之前再找下一个阻塞的子 span；
+        并发执行、被它覆盖的子 span 不在关键路径上。子 span 超出父 span 的部分（时钟偏差）会被裁掉，
+        因此各段时间之和正好等于根 span 的耗时。每个 span 只访问一次，复杂度为 O(n log k)，k 为子 span 数。
+        :return: 按时间顺序排列的 [(span, 段开始时间, 段结束时间), ...]，每段时间里关键路径停留在该 span 自身
+        """
+        roots = self.root_spans
+        if not roots:
+            return []
+        root = max(roots, key=lambda s: s.end_time)
+        segments = []
+
+        def frame(span, lower, upper):
+            # [span, 段下界, 游标, 按结束时间从晚到早的子 span, 下一个子 span 的下标]
+            return [span, max(span.start_time, lower), min(span.end_time, upper),
+                    sorted(span.children, key=lambda c: c.end_time, reverse=True), 0]
+
+        # 用显式栈代替递归，很深的调用链不会超过递归深度限制
+        stack = [frame(root, root.start_time, root.end_time)]
+        while stack:
+            top = stack[-1]
+            span, begin, cursor, children, i = top
+            descended = False
+            while i < len(children) and cursor > begin:
+                child = children[i]
+                i += 1
+                if child.start_time >= cursor:
+                    continue
+                if child.end_time <= begin:
+                    # 之后的子 span 都在父 span 开始之前就结束了（时钟偏差），不在关键路径上
+                    break
+                child_end = min(child.end_time, cursor)
+                if child_end < cursor:
+                    segments.append((span, child_end, cursor))
+                top[2], top[4] = max(child.start_time, begin), i
+                stack.append(frame(child, begin, child_end))
+                descended = True
+                break
+            if descended:
+                continue
+            if cursor > begin:
+                segments.append((span, begin, cursor))
+            stack.pop()
+
+        segments.reverse()
+        return segments
+
     def get_pod_sequence(self):
         seq = []
 
@@ -102,6 +440,335 @@ class Trace:
             "service_names": list(self.service_map.values()),
         }
 
+class SpanTable:
+    """
+    列式（struct-of-arrays）的 span 表示：所有 trace 的 span 按 trace 顺序连续存放在一组 NumPy 数组中，
+    服务名、pod 名做字典编码。总耗时、根 span、调用边延迟、pod 计数等统计都是对整列的向量化计算，
+    不需要在 Python 中逐个遍历 Span 对象，适合上百万 span 的分析。
+
+    列（长度均为 span 数，第 i 个 trace 的 span 位于 [trace_offsets[i], trace_offsets[i + 1])）：
+      trace_index   int32   所属 trace 的下标
+      span_ids      uint64  spanID（16 位十六进制转成整数；无法转换时退化为 object 数组保存原字符串）
+      parent_index  int64   父 span 的行号，没有父 span 或父 span 不在本 trace 中时为 -1
+      has_parent    bool    是否带有父 span 引用（为 False 的是根 span）
+      start_time    int64   开始时间（微秒）
+      duration      int64   耗时（微秒）
+      service_code  int32   services 中的下标
+      pod_code      int32   pods 中的下标
+      operation_code int32  operations 中的下标
+    trace_shapes 为每条 trace 的结构指纹（Trace.shape）
+    """
+
+    def __init__(self, trace_ids, trace_offsets, span_ids, parent_index, has_parent, start_time, duration,
+                 service_code, pod_code, services, pods, orphan_parents=None,
+                 operation_code=None, operations=None, trace_shapes=None):
+        self.trace_ids = list(trace_ids)
+        self.trace_offsets = np.asarray(trace_offsets, dtype=np.int64)
+        self.trace_index = np.repeat(np.arange(len(self.trace_ids), dtype=np.int32), np.diff(self.trace_offsets))
+        self.span_ids = span_ids
+        self.parent_index = np.asarray(parent_index, dtype=np.int64)
+        self.has_parent = np.asarray(has_parent, dtype=bool)
+        self.start_time = np.asarray(start_time, dtype=np.int64)
+        self.duration = np.asarray(duration, dtype=np.int64)
+        self.service_code = np.asarray(service_code, dtype=np.int32)
+        self.pod_code = np.asarray(pod_code, dtype=np.int32)
+        self.services = list(services)
+        self.pods = list(pods)
+        # 父 span 不在本 trace 中的 span：行号 -> 原始父 spanID，只用于 to_traces 还原
+        self.orphan_parents = orphan_parents or {}
+        if operation_code is None:
+            operation_code, operations = np.zeros(len(self.start_time), dtype=np.int32), [""]
+        self.operation_code = np.asarray(operation_code, dtype=np.int32)
+        self.operations = list(operations)
+        self.trace_shapes = list(trace_shapes) if trace_shapes is not None else None
+
+    def __len__(self):
+        return len(self.start_time)
+
+    @property
+    def num_traces(self):
+        return len(self.trace_ids)
+
+    @property
+    def end_time(self):
+        return self.start_time + self.duration
+
+    @staticmethod
+    def _encode_ids(ids):
+        try:
+            return np.array([int(span_id, 16) for span_id in ids], dtype=np.uint64)
+        except (ValueError, OverflowError):
+            return np.array(ids, dtype=object)
+
+    def _decode_id(self, row):
+        span_id = self.span_ids[row]
+        return f"{int(span_id):016x}" if self.span_ids.dtype == np.uint64 else span_id
+
+    @classmethod
+    def from_traces(cls, traces):
+        """
+        由 Trace 对象（列表、TraceChunks 等任意可迭代对象）构造 SpanTable
+        """
+        trace_ids, offsets = [], [0]
+        span_ids, parent_index, has_parent, start_time, duration, service_code, pod_code = [], [], [], [], [], [], []
+        operation_code, trace_shapes = [], []
+        orphan_parents = {}
+        service_codes, pod_codes, operation_codes = {}, {}, {}
+
+        for trace in traces:
+            base = offsets[-1]
+            rows = {span.span_id: base + i for i, span in enumerate(trace.spans)}
+            for span in trace.spans:
+                parent_row = rows.get(span.parent_id, -1) if span.parent_id else -1
+                if span.parent_id and parent_row < 0:
+                    orphan_parents[len(span_ids)] = span.parent_id
+                span_ids.append(span.span_id)
+                parent_index.append(parent_row)
+                has_parent.append(span.parent_id is not None)
+                start_time.append(span.start_time)
+                duration.append(span.duration)
+                service_code.append(service_codes.setdefault(span.service_name, len(service_codes)))
+                pod_code.append(pod_codes.setdefault(span.pod_id, len(pod_codes)))
+                operation_code.append(operation_codes.setdefault(span.operation, len(operation_codes)))
+            trace_ids.append(trace.trace_id)
+            trace_shapes.append(trace.shape)
+            offsets.append(base + len(trace.spans))
+
+        return cls(trace_ids, offsets, cls._encode_ids(span_ids), parent_index, has_parent, start_time, duration,
+                   service_code, pod_code, service_codes, pod_codes, orphan_parents,
+                   operation_code, operation_codes or [""], trace_shapes)
+
+    def to_traces(self, lazy=False):
+        """
+        转换回 Trace 对象列表。service_map 按 trace 中出现的服务重新编号（p1, p2, ...）
+        :param lazy: 是否得到打包好的惰性 Trace（见 Trace.pack）
+        """
+        traces = []
+        for i, trace_id in enumerate(self.trace_ids):
+            begin, end = self.trace_offsets[i], self.trace_offsets[i + 1]
+            states = []
+            for row in range(begin, end):
+                parent_row = self.parent_index[row]
+                if parent_row >= 0:
+                    parent_id = self._decode_id(parent_row)
+                else:
+                    parent_id = self.orphan_parents.get(row) if self.has_parent[row] else None
+                states.append((self._decode_id(row), parent_id, int(self.start_time[row]), int(self.duration[row]),
+                               self.pods[self.pod_code[row]], self.services[self.service_code[row]],
+                               self.operations[self.operation_code[row]]))
+
+            service_names = dict.fromkeys(state[5] for state in states)
+            service_map = {f"p{n + 1}": name for n, name in enumerate(service_names)}
+            traces.append(Trace.from_span_states(trace_id, service_map, states, lazy=lazy))
+        return traces
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        按顺序拼接多个 SpanTable，服务名、pod 名、operation 的字典编码合并后重新映射
+        """
+        tables = list(tables)
+        if not tables:
+            return cls.from_traces([])
+        if len(tables) == 1:
+            return tables[0]
+
+        def merge_codes(attr, names_attr):
+            merged, columns = {}, []
+            for table in tables:
+                mapping = np.array([merged.setdefault(name, len(merged)) for name in getattr(table, names_attr)],
+                                   dtype=np.int32)
+                columns.append(mapping[getattr(table, attr)])
+            return np.concatenate(columns), list(merged) or [""]
+
+        service_code, services = merge_codes("service_code", "services")
+        pod_code, pods = merge_codes("pod_code", "pods")
+        operation_code, operations = merge_codes("operation_code", "operations")
+
+        if all(table.span_ids.dtype == np.uint64 for table in tables):
+            span_ids = np.concatenate([table.span_ids for table in tables])
+        else:
+            span_ids = np.array([table._decode_id(row) for table in tables for row in range(len(table))],
+                                dtype=object)
+
+        trace_ids, offsets, parent_index, orphan_parents = [], [np.zeros(1, dtype=np.int64)], [], {}
+        row_base = 0
+        for table in tables:
+            trace_ids.extend(table.trace_ids)
+            offsets.append(table.trace_offsets[1:] + row_base)
+            parent_index.append(np.where(table.parent_index >= 0, table.parent_index + row_base, -1))
+            orphan_parents.update((row + row_base, parent_id) for row, parent_id in table.orphan_parents.items())
+            row_base += len(table)
+
+        trace_shapes = None
+        if all(table.trace_shapes is not None for table in tables):
+            trace_shapes = [shape for table in tables for shape in table.trace_shapes]
+
+        return cls(trace_ids, np.concatenate(offsets), span_ids, np.concatenate(parent_index),
+                   np.concatenate([table.has_parent for table in tables]),
+                   np.concatenate([table.start_time for table in tables]),
+                   np.concatenate([table.duration for table in tables]),
+                   service_code, pod_code, services, pods, orphan_parents,
+                   operation_code, operations, trace_shapes)
+
+    def _per_trace(self, ufunc, values):
+        # 按 trace 分段归约；reduceat 遇到空段会返回下一个元素，空 trace 单独置 0
+        counts = np.diff(self.trace_offsets)
+        result = np.zeros(self.num_traces, dtype=values.dtype)
+        nonempty = counts > 0
+        if nonempty.any():
+            result[nonempty] = ufunc.reduceat(values, self.trace_offsets[:-1][nonempty])
+        return result
+
+    def trace_start_times(self):
+        return self._per_trace(np.minimum, self.start_time)
+
+    def total_durations(self):
+        """
+        每条 trace 的总耗时（最晚结束时间 - 最早开始时间），与 Trace.total_duration 一致
+        """
+        return self._per_trace(np.maximum, self.end_time) - self.trace_start_times()
+
+    def root_rows(self):
+        """
+        根 span 的行号，与各 Trace.root_spans 对应
+        """
+        return np.flatnonzero(~self.has_parent)
+
+    def edges(self):
+        """
+        所有父子调用边
+        :return: (父 span 行号, 子 span 行号)
+        """
+        child_rows = np.flatnonzero(self.parent_index >= 0)
+        return self.parent_index[child_rows], child_rows
+
+    def edge_latencies(self):
+        """
+        每条调用边上子 span 相对父 span 的启动延迟，与 Trace.get_upstream_downstream_latencies 的 latency 一致
+        """
+        parent_rows, child_rows = self.edges()
+        return self.start_time[child_rows] - self.start_time[parent_rows]
+
+    def critical_path_times(self):
+        """
+        批量计算所有 trace 的关键路径（算法同 Trace.critical_path），返回每个 span 在关键路径上停留的时间。
+        子 span 的分组和按结束时间排序对整列一次完成，之后每个 span 只访问一次
+        :return: 长度为 span 数的 int64 数组，可以配合 service_code / pod_code 用 np.bincount 聚合
+        """
+        num_rows = len(self)
+        times = [0] * num_rows
+        if num_rows == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        # 子 span 按父 span 分组、组内按结束时间从晚到早排列
+        end_time = self.end_time
+        child_rows = np.flatnonzero(self.parent_index >= 0)
+        parents = self.parent_index[child_rows]
+        ordered = child_rows[np.lexsort((-end_time[child_rows], parents))].tolist()
+        first_child = np.concatenate(([0], np.cumsum(np.bincount(parents, minlength=num_rows)))).tolist()
+
+        # 每条 trace 取结束时间最晚的根 span（相同时取靠前的）
+        roots = self.root_rows()
+        roots = roots[np.lexsort((-roots, end_time[roots], self.trace_index[roots]))]
+        last_of_trace = np.append(self.trace_index[roots][1:] != self.trace_index[roots][:-1], True)
+
+        starts = self.start_time.tolist()
+        ends = end_time.tolist()
+
+        for root in roots[last_of_trace].tolist():
+            # 与 Trace.critical_path 相同的显式栈，每帧为 [row, 段下界, 游标, 下一个子 span 在 ordered 中的下标]
+            stack = [[root, starts[root], ends[root], first_child[root]]]
+            while stack:
+                top = stack[-1]
+                row, begin, cursor, i = top
+                last = first_child[row + 1]
+                descended = False
+                while i < last and cursor > begin:
+                    child = ordered[i]
+                    i += 1
+                    if starts[child] >= cursor:
+                        continue
+                    if ends[child] <= begin:
+                        # 之后的子 span 都在父 span 开始之前就结束了（时钟偏差），不在关键路径上
+                        break
+                    child_end = min(ends[child], cursor)
+                    times[row] += cursor - child_end
+                    top[2], top[3] = max(starts[child], begin), i
+                    stack.append([child, max(starts[child], begin), child_end, first_child[child]])
+                    descended = True
+                    break
+                if descended:
+                    continue
+                if cursor > begin:
+                    times[row] += cursor - begin
+                stack.pop()
+        return np.array(times, dtype=np.int64)
+
+    def self_times(self):
+        """
+        批量计算每个 span 的自身耗时（同 Span.self_time），全部是向量化运算：
+        子 span 按 (父 span, 开始时间) 排序并把两端都裁剪到父 span 区间内，换算成相对父 span 开始的时间后
+        给每组加上互不重叠的偏移，这样一次 np.maximum.accumulate 就得到每组内此前子 span 的最晚结束时间，
+        每个子 span 只贡献超出这个时间的部分
+        :return: 长度为 span 数的 int64 数组
+        """
+        child_rows = np.flatnonzero(self.parent_index >= 0)
+        if len(child_rows) == 0:
+            return self.duration.copy()
+
+        parents = self.parent_index[child_rows]
+        order = np.lexsort((self.start_time[child_rows], parents))
+        child_rows, parents = child_rows[order], parents[order]
+
+        # 两端都裁剪到 [0, 父 span duration]：父 span 结束后才开始的子 span（FOLLOWS_FROM、时钟偏差）
+        # 否则会越过本组的偏移范围，落进下一个父 span 的组里
+        parent_start = self.start_time[parents]
+        parent_duration = self.duration[parents]
+        rel_start = np.clip(self.start_time[child_rows] - parent_start, 0, parent_duration)
+        rel_end = np.clip(self.end_time[child_rows] - parent_start, rel_start, parent_duration)
+
+        # 每个父 span 一组，组号乘以大于任何相对时间的跨度，保证前一组的值都小于后一组
+        group_start = np.concatenate(([True], parents[1:] != parents[:-1]))
+        offset = np.cumsum(group_start) * (int(self.duration.max()) + 1)
+        begin, end = rel_start + offset, rel_end + offset
+        previous_end = np.concatenate(([0], np.maximum.accumulate(end)[:-1]))
+        covered = np.maximum(end - np.maximum(begin, previous_end), 0)
+
+        return self.duration - np.bincount(parents, weights=covered, minlength=len(self)).astype(np.int64)
+
+    def pod_counts(self):
+        """
+        每个 pod 上的 span 数
+        """
+        counts = np.bincount(self.pod_code, minlength=len(self.pods))
+        return dict(zip(self.pods, counts.tolist()))
+
+    def service_counts(self):
+        counts = np.bincount(self.service_code, minlength=len(self.services))
+        return dict(zip(self.services, counts.tolist()))
+
+    def edge_stats(self, level="pod"):
+        """
+        按 (上游, 下游) pod 或服务聚合调用边
+        :param level: "pod" 或 "service"
+        :return: {(上游, 下游): {"count", "mean_latency", "mean_duration"}}，mean_duration 是下游 span 的平均耗时
+        """
+        codes, names = (self.pod_code, self.pods) if level == "pod" else (self.service_code, self.services)
+        parent_rows, child_rows = self.edges()
+        pairs = codes[parent_rows].astype(np.int64) * len(names) + codes[child_rows]
+        keys, inverse, counts = np.unique(pairs, return_inverse=True, return_counts=True)
+        latency = np.bincount(inverse, weights=self.start_time[child_rows] - self.start_time[parent_rows])
+        duration = np.bincount(inverse, weights=self.duration[child_rows])
+        return {
+            (names[key // len(names)], names[key % len(names)]): {
+                "count": int(count),
+                "mean_latency": latency[i] / count,
+                "mean_duration": duration[i] / count,
+            }
+            for i, (key, count) in enumerate(zip(keys.tolist(), counts.tolist()))
+        }
+
 if __name__ == "__main__":
     import json
     with open("trace_example.json", "r") as f:
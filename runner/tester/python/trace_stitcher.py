@@ -0,0 +1,90 @@
+import json
+import threading
+
+def looks_truncated(trace_json):
+    """
+    判断 Jaeger 格式的 trace 是否不完整：
+    存在找不到父 span 的引用，或者 processes 里有进程没有任何 span
+    """
+    spans = trace_json.get("spans") or []
+    span_ids = {span["spanID"] for span in spans}
+    for span in spans:
+        for ref in span.get("references") or []:
+            if ref.get("refType", "CHILD_OF") == "CHILD_OF" and ref["spanID"] not in span_ids:
+                return True
+
+    used_processes = {span.get("processID") for span in spans}
+    return any(pid not in used_processes for pid in trace_json.get("processes", {}))
+
+def merge_trace_json(target, other):
+    """
+    把 other 中 target 没有的 spans（按 spanID 判断）合并进 target，原地修改。
+    两份 trace 的 processID 不一定一致，按 (serviceName, tags) 重新映射
+    """
+    process_keys = {
+        (info.get("serviceName"), json.dumps(info.get("tags") or [], sort_keys=True)): pid
+        for pid, info in target["processes"].items()
+    }
+    pid_map = {}
+    for pid, info in other.get("processes", {}).items():
+        key = (info.get("serviceName"), json.dumps(info.get("tags") or [], sort_keys=True))
+        if key not in process_keys:
+            new_pid = f"p{len(target['processes']) + 1}"
+            while new_pid in target["processes"]:
+                new_pid += "'"
+            target["processes"][new_pid] = info
+            process_keys[key] = new_pid
+        pid_map[pid] = process_keys[key]
+
+    span_ids = {span["spanID"] for span in target["spans"]}
+    for span in other.get("spans") or []:
+        if span["spanID"] not in span_ids:
+            span_ids.add(span["spanID"])
+            target["spans"].append(dict(span, processID=pid_map.get(span.get("processID"), span.get("processID"))))
+    target["spans"].sort(key=lambda s: s["startTime"])
+    return target
+
+class TraceStitcher:
+    """
+    多服务拉取时拼接不完整的 trace：同一条 trace 可能从多个服务的搜索结果中各拿到一部分 spans，
+    按 traceID 暂存不完整的 trace，之后每遇到同一 traceID 的副本就按 spanID 合并，合并完整后立即交还给调用方。
+    完整的 trace 不会进入这里，内存中只保留仍不完整的那部分。
+    """
+
+    def __init__(self):
+        self.partial = {}
+        self.stitched = 0
+        self._lock = threading.Lock()
+
+    def is_partial(self, trace_id):
+        with self._lock:
+            return trace_id in self.partial
+
+    def add(self, trace_json):
+        """
+        加入一份 trace 副本
+        :return: 合并后已完整的 trace dict；仍不完整时返回 None
+        """
+        trace_id = trace_json["traceID"]
+        with self._lock:
+            existing = self.partial.get(trace_id)
+            if existing is None:
+                if not looks_truncated(trace_json):
+                    return trace_json
+                self.partial[trace_id] = trace_json
+                return None
+
+            merge_trace_json(existing, trace_json)
+            if looks_truncated(existing):
+                return None
+            del self.partial[trace_id]
+            self.stitched += 1
+            return existing
+
+    def drain(self):
+        """
+        取出所有仍不完整的 trace
+        """
+        with self._lock:
+            partial, self.partial = self.partial, {}
+        return list(partial.values())
@@ -0,0 +1,225 @@
+import gzip
+import json
+import os
+import pickle
+import threading
+
+from shape_index import SHAPE_INDEX, ShapeIndex
+from trace_model import SpanTable
+
+CHUNK_DIR = "trace_chunks"
+CHUNK_INDEX = "index.json"
+CHUNK_TRACE_IDS = "trace_ids.txt"
+# 按 trace 开始时间分区的粒度（微秒），默认每分钟一个分区
+PARTITION_US = 60_000_000
+
+def _chunk_filename(index):
+    return f"chunk_{index:05d}.pkl.gz"
+
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+class TraceChunkWriter:
+    """
+    把 Trace 对象按固定条数滚动写入 {output_dir}/trace_chunks/chunk_xxxxx.pkl.gz，
+    内存中最多只保留约一个 chunk 的 traces。每写完一个 chunk 就更新 index.json，中途退出时已写入的数据仍可读取。
+    traces 按开始时间分区（默认每分钟），一个 chunk 只包含同一分区的 traces，index.json 中记录每个 chunk 的
+    最早 / 最晚开始时间（稀疏索引），按时间范围查询时只读取有重叠的 chunk（见 TraceChunks.query）。
+    resume=True 时接着已有的 index.json 继续写，否则清空目录中已有的 chunk，从第 0 个 chunk 重新开始。
+    已落盘 trace 的 traceID 追加记录在 trace_ids.txt 中，供断点续传时恢复去重集合。
+    同时维护结构索引（见 ShapeIndex），close 时保存为 shape_index.json.gz；续写时已有索引与 index.json 不一致则不再维护，
+    读取时（load_shape_index）会重新建立。
+    """
+
+    def __init__(self, output_dir, chunk_size=10000, resume=False, partition_us=PARTITION_US):
+        """
+        :param partition_us: 分区粒度（微秒），为 None 时不分区，按到达顺序切分 chunk
+        """
+        self.chunk_dir = os.path.join(output_dir, CHUNK_DIR)
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        self.chunk_size = max(1, chunk_size)
+        self.index_file = os.path.join(self.chunk_dir, CHUNK_INDEX)
+        self.ids_file = os.path.join(self.chunk_dir, CHUNK_TRACE_IDS)
+        self.shape_file = os.path.join(self.chunk_dir, SHAPE_INDEX)
+        self.index = {"chunks": [], "total": 0}
+        self.shapes = ShapeIndex()
+        if resume and os.path.isfile(self.index_file):
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+            self.shapes = self._load_shapes()
+        else:
+            self._clear()
+        self._truncate_ids_file()
+        self.partition_us = partition_us
+        # 分区 -> 尚未写出的 traces
+        self._buckets = {}
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    @property
+    def chunk_index(self):
+        return len(self.index["chunks"])
+
+    @property
+    def total(self):
+        return self.index["total"] + self._buffered
+
+    def add(self, trace):
+        self.extend([trace])
+
+    def extend(self, traces):
+        with self._lock:
+            for trace in traces:
+                key = trace.start_time // self.partition_us if self.partition_us else 0
+                bucket = self._buckets.setdefault(key, [])
+                bucket.append(trace)
+                self._buffered += 1
+                if len(bucket) >= self.chunk_size:
+                    self._write_bucket(key)
+            # 乱序到达时同时有多个分区在缓冲，总数超过 chunk_size 时先写出最大的分区
+            while self._buffered >= self.chunk_size:
+                self._write_bucket(max(self._buckets, key=lambda k: len(self._buckets[k])))
+
+    def flush(self):
+        with self._lock:
+            for key in sorted(self._buckets):
+                self._write_bucket(key)
+
+    def _write_bucket(self, key):
+        traces = self._buckets.pop(key)
+        self._buffered -= len(traces)
+        self._write_chunk(traces)
+
+    def close(self):
+        self.flush()
+        if self.shapes is not None:
+            self.shapes.save(self.shape_file)
+        print(f"✅ {self.total} 条 traces 已分 {self.chunk_index} 个 chunk 保存至 {self.chunk_dir}")
+
+    def load_trace_ids(self):
+        """
+        读取已写入 chunk 的所有 traceID
+        """
+        with open(self.ids_file) as f:
+            return set(f.read().split())
+
+    def _load_shapes(self):
+        if not self.index["total"]:
+            return ShapeIndex()
+        if os.path.isfile(self.shape_file):
+            shapes = ShapeIndex.load(self.shape_file)
+            if shapes.total == self.index["total"]:
+                return shapes
+            os.remove(self.shape_file)
+        return None
+
+    def _clear(self):
+        # 不续写时先写空的 index.json 再删除上一次的 chunk 和结构索引：
+        # 即使这一次一条 trace 也没有写出，TraceChunks 也不会读到上一次的数据
+        write_json_atomic(self.index_file, self.index)
+        for name in os.listdir(self.chunk_dir):
+            if name == SHAPE_INDEX or (name.startswith("chunk_") and name.endswith(".pkl.gz")):
+                os.remove(os.path.join(self.chunk_dir, name))
+
+    def _truncate_ids_file(self):
+        # 只保留 index.json 中已记录的 chunk 对应的 traceID，丢弃写了一半的部分
+        ids_size = self.index["chunks"][-1]["ids_size"] if self.index["chunks"] else 0
+        with open(self.ids_file, "a") as f:
+            f.truncate(ids_size)
+
+    def _write_chunk(self, traces):
+        filename = _chunk_filename(self.chunk_index)
+        with gzip.open(os.path.join(self.chunk_dir, filename), "wb") as out:
+            pickle.dump(traces, out)
+        with open(self.ids_file, "a") as f:
+            f.write("".join(f"{trace.trace_id}\n" for trace in traces))
+            ids_size = f.tell()
+        self.index["chunks"].append({
+            "file": filename,
+            "count": len(traces),
+            "ids_size": ids_size,
+            "min_start": min(trace.start_time for trace in traces),
+            "max_start": max(trace.start_time for trace in traces),
+        })
+        self.index["total"] += len(traces)
+        write_json_atomic(self.index_file, self.index)
+        if self.shapes is not None:
+            self.shapes.extend(traces)
+
+class TraceChunks:
+    """
+    chunk 目录的只读视图：可以多次迭代，每次迭代都按 chunk 惰性加载，不会一次性读入全部 traces
+    """
+
+    def __init__(self, folder):
+        self.chunk_dir = os.path.join(folder, CHUNK_DIR)
+        with open(os.path.join(self.chunk_dir, CHUNK_INDEX)) as f:
+            self.index = json.load(f)
+
+    def __len__(self):
+        return self.index["total"]
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            yield from chunk
+
+    def chunk_paths(self):
+        return [os.path.join(self.chunk_dir, entry["file"]) for entry in self.index["chunks"]]
+
+    def iter_chunks(self):
+        for path in self.chunk_paths():
+            yield load_chunk(path)
+
+    def blocks(self, start_time=None, end_time=None):
+        """
+        开始时间范围与 [start_time, end_time) 有重叠的 chunk（index.json 中的条目）；
+        旧版本写出的 chunk 没有记录时间范围，总是包含在内
+        """
+        return [entry for entry in self.index["chunks"]
+                if (start_time is None or entry.get("max_start", start_time) >= start_time)
+                and (end_time is None or entry.get("min_start", end_time - 1) < end_time)]
+
+    def query(self, start_time=None, end_time=None):
+        """
+        逐条产出开始时间在 [start_time, end_time) 内的 traces，只读取有重叠的 chunk，
+        读取量与时间范围的大小成正比，与整个实验的大小无关
+        """
+        for entry in self.blocks(start_time, end_time):
+            for trace in load_chunk(os.path.join(self.chunk_dir, entry["file"])):
+                if (start_time is None or trace.start_time >= start_time) and \
+                        (end_time is None or trace.start_time < end_time):
+                    yield trace
+
+def load_chunk(path):
+    with gzip.open(path, "rb") as f:
+        return pickle.load(f)
+
+def has_chunks(folder):
+    return os.path.isfile(os.path.join(folder, CHUNK_DIR, CHUNK_INDEX))
+
+def load_shape_index(algo_dir, traces) -> ShapeIndex:
+    """
+    读取算法目录下的结构索引（chunk 存储在 trace_chunks/ 中，否则在算法目录下）。
+    不存在或条数与数据不一致（中途退出、续写后索引失效）时用 traces 重新建立并保存
+    :param traces: 该算法已加载的 traces 或 SpanTable
+    """
+    if has_chunks(algo_dir):
+        path = os.path.join(algo_dir, CHUNK_DIR, SHAPE_INDEX)
+    else:
+        path = os.path.join(algo_dir, SHAPE_INDEX)
+
+    if os.path.isfile(path):
+        index = ShapeIndex.load(path)
+        count = traces.num_traces if isinstance(traces, SpanTable) else len(traces)
+        if index.total == count:
+            return index
+        print(f"⚠️ 结构索引与数据条数不一致（{index.total} / {count}），重新建立: {path}")
+
+    index = ShapeIndex.from_traces(traces)
+    # 只在 span_store 中的算法没有对应目录，不保存
+    if index.total and os.path.isdir(os.path.dirname(path)):
+        index.save(path)
+    return index
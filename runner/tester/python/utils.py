@@ -8,13 +8,17 @@ from typing import Tuple
 import gzip
 import pickle
 import json
+import math
+from fractions import Fraction
+from trace_store import TraceChunks, has_chunks
+import span_store
 
-def get_jaeger_nodeport():
+def get_nodeport(service, port_name, namespace="istio-system"):
     try:
         result = subprocess.run(
             [
-                "kubectl", "get", "svc", "tracing", "-n", "istio-system",
-                "-o", "jsonpath={.spec.ports[?(@.name=='http-query')].nodePort}"
+                "kubectl", "get", "svc", service, "-n", namespace,
+                "-o", f"jsonpath={{.spec.ports[?(@.name=='{port_name}')].nodePort}}"
             ],
             capture_output=True,
             text=True,
@@ -26,6 +30,12 @@ def get_jaeger_nodeport():
         print(f"Error executing kubectl command: {e}")
         return None
 
+def get_jaeger_nodeport():
+    return get_nodeport("tracing", "http-query")
+
+def get_prometheus_nodeport():
+    return get_nodeport("prometheus", "http")
+
 def get_service_name_of_span(span):
     # 提取服务名称
     service_name = "unknown"
@@ -51,6 +61,25 @@ def get_pod_name_of_span(span):
 
     return pod_name
 
+def tail_percentiles(durations, population, quantiles=(0.9, 0.99, 0.999)):
+    """
+    根据只包含慢 trace 的样本（例如用 minDuration 过滤后拉取的 traces）和未过滤的总体数量计算尾部分位数。
+    按最近秩定义，分位数 q 是总体中从小到大第 k = ceil(q * population) 个值，即第 population - k + 1 大的值，
+    与 np.percentile(..., method="inverted_cdf") 相同；只要样本里有这么多条就能精确算出，
+    样本不够（过滤阈值太高）时该分位数为 None。
+    :param durations: 过滤后样本的耗时列表
+    :param population: 未过滤的 trace 总数
+    :return: {q: 分位数}
+    """
+    durations = sorted(durations, reverse=True)
+    result = {}
+    for q in quantiles:
+        # 用 Fraction 精确计算 q * population，避免 0.9 * 1000 这类浮点误差让秩差一位
+        k = max(1, math.ceil(Fraction(str(q)) * population))
+        rank = population - k + 1
+        result[q] = durations[rank - 1] if 1 <= rank <= len(durations) else None
+    return result
+
 def format_duration(duration):
     if duration < 1e3:
         return f"{duration:.1f}μs"
@@ -156,10 +185,22 @@ def save_traces(traces, folder="./", filename="trace_results.pkl"):
 
 def load_traces(folder="./", filename="trace_results.pkl"):
     """
-    从 pkl 文件加载 Jaeger trace 数据
+    从 pkl 文件加载 Jaeger trace 数据；如果 folder 下有流式拉取写出的 trace_chunks，则返回按 chunk 惰性迭代的视图。
+    folder 是算法目录且实验目录下的 span_store 中有该算法时，优先从 Parquet 读取
     :param filename: 保存文件名
     :return: trace 数据
     """
+    experiment_dir, algo = os.path.split(os.path.normpath(folder))
+    if span_store.has_algo(experiment_dir, algo):
+        traces = span_store.load_span_table(experiment_dir, algo).to_traces(lazy=True)
+        print(f"📁 从 span_store 加载 {len(traces)} 条 traces.")
+        return traces
+
+    if has_chunks(folder):
+        traces = TraceChunks(folder)
+        print(f"📁 发现 {len(traces.index['chunks'])} 个 trace chunk，共 {len(traces)} 条 traces.")
+        return traces
+
     load_path = os.path.join(folder, filename)
     if os.path.exists(load_path):
         with gzip.open(load_path, 'rb') as f: